@@ -1,17 +1,36 @@
 import sys
 import logging
 import argparse
+import functools
 import environs
 from collections import defaultdict
-from sqlalchemy import sql
+from datetime import datetime, timedelta
+from sqlalchemy import sql, func
 
-from my_github.db_session import create_session
+from my_github.db_session import create_scoped_session, upsert
 from my_github.models import (
     GitHubEvent, EventSourceEnum, GitHubUserStats,
-    GitHubUserDynamicStats
+    GitHubUserDynamicStats, GitHubPullRequestFile, GitHubSyncCheckpoint,
+    GitHubPushCommit
 )
 from my_github.github_api import GitHubRestAPI, GitHubGraphQLAPI, datetime_from_github_time
+from my_github.transport import TransportConfig
 from my_github.event_parser import EventParser
+from my_github.commit_cache import CommitCache
+from my_github.task_runner import Task, TaskRunner
+from my_github.pipeline import Pipeline
+from my_github.event_filter import KnownEventIds
+from my_github.event_store import add_push_commits, writable_event_rows
+from my_github.reparse import reparse_events
+from my_github import queries, profiling
+from my_github.webhook import (
+    WebhookEventBatcher, create_webhook_server,
+    find_superseded_webhook_events, find_unmatched_webhook_events
+)
+from my_github.stats import (
+    StatsChangeDetector, compact_stats, COMPACT_GRANULARITIES,
+    billing_breakdown_dimension, backfill_billing_breakdown
+)
 
 logger = logging.getLogger(__name__)
 
@@ -22,90 +41,268 @@ env.read_env(recurse=False)
 
 DEBUG = env.bool('DEBUG', False)
 
-session = create_session(
-    env.str('DB_URL'),
-    use_ssl=env.bool('DB_USE_SSL', True),
-    ssl_ca_path=env.str('DB_SSL_CA_PATH', '/etc/ssl/cert.pem'),
-)
-github_login = {
-    'username': env.str('MY_GITHUB_USERNAME'),
-    'token': env.str('MY_GITHUB_TOKEN')
-}
-rest_api = GitHubRestAPI(**github_login)
-graphql_api = GitHubGraphQLAPI(**github_login)
+# built by setup(), so importing this module (e.g. by the spawned reparse
+# workers, which re-import the main module) needs no environment or connections
+session = None
+rest_api = None
+graphql_api = None
+commit_cache = None
+stats_change_detector = None
+
+
+def setup():
+    global session, rest_api, graphql_api, commit_cache, stats_change_detector
+    # every sync task runs in its own thread with its own session
+    session = create_scoped_session(
+        env.str('DB_URL'),
+        use_ssl=env.bool('DB_USE_SSL', True),
+        ssl_ca_path=env.str('DB_SSL_CA_PATH', '/etc/ssl/cert.pem'),
+    )
+    github_login = {
+        'username': env.str('MY_GITHUB_USERNAME'),
+        'token': env.str('MY_GITHUB_TOKEN')
+    }
+    # both clients share the pool size, timeouts and retry policy
+    transport = TransportConfig(
+        pool_size=env.int('HTTP_POOL_SIZE', 10),
+        connect_timeout=env.float('HTTP_CONNECT_TIMEOUT', 5),
+        read_timeout=env.float('HTTP_READ_TIMEOUT', 30),
+        max_retries=env.int('HTTP_MAX_RETRIES', 3),
+    )
+    rest_api = GitHubRestAPI(**github_login, transport=transport)
+    commit_cache = CommitCache(
+        env.str('COMMIT_CACHE_PATH', '.commit_cache.sqlite'),
+        negative_ttl=env.int('COMMIT_CACHE_NEGATIVE_TTL', 7 * 24 * 3600),
+    )
+    graphql_api = GitHubGraphQLAPI(**github_login, commit_cache=commit_cache, transport=transport)
+    # stats are only written when changed, or at least once per heartbeat
+    stats_change_detector = StatsChangeDetector(
+        heartbeat=timedelta(hours=env.int('STATS_HEARTBEAT_HOURS', 24))
+    )
+
+
+def parse_github_events(raw_events):
+    with profiling.timed('event_parser'):
+        return [EventParser(e) for e in raw_events]
+
+
+def write_github_events(event_source, events):
+    # events are EventParser instances
+    if not events:
+        return
+    logger.debug(f'saving github events')
+    upsert(session, GitHubEvent, writable_event_rows(session, [
+        {**e.event_dict, 'event_source': event_source} for e in events
+    ]))
+    add_push_commits(session, [(e.id, e.repo_id, e.push_commits) for e in events])
+    if event_source != EventSourceEnum.WEBHOOK.value:
+        # polling reconciles the events already received by webhooks, and
+        # drops the ones it has passed without publishing them
+        event_dicts = [e.event_dict for e in events]
+        superseded_ids = find_superseded_webhook_events(session, event_dicts)
+        unmatched_ids = find_unmatched_webhook_events(session, event_dicts)
+        stale_ids = set(superseded_ids) | set(unmatched_ids)
+        if stale_ids:
+            logger.debug(
+                f'{ len(superseded_ids) } webhook events superseded, '
+                f'{ len(stale_ids) - len(superseded_ids) } unmatched dropped'
+            )
+            session.query(GitHubEvent).where(
+                GitHubEvent.id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+            session.query(GitHubPushCommit).where(
+                GitHubPushCommit.event_id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+    session.commit()
+    queries.invalidate(session, GitHubEvent.__tablename__, GitHubPushCommit.__tablename__)
 
 
 def save_github_events(event_source, raw_events):
     if not raw_events:
         return
-    logger.debug(f'saving github events')
-    for e in raw_events:
-        session.merge(GitHubEvent(
-            **EventParser(e).event_dict,
+    write_github_events(event_source, parse_github_events(raw_events))
+
+
+def _run_events_pipeline(event_source, fetch_pages, write_page):
+    # fetch, parse and write pages of events concurrently, the events already
+    # stored are dropped before parsing
+    known_event_ids = KnownEventIds.load(session, event_source)
+    session.commit()
+    logger.debug(f'{ len(known_event_ids) } known { event_source } events')
+
+    def parse(item):
+        page, raw_events, *rest = item
+        new_events = known_event_ids.filter_new(raw_events)
+        logger.debug(f'page { page }: { len(new_events) } of { len(raw_events) } events are new')
+        return (page, parse_github_events(new_events), *rest)
+
+    def write(item):
+        write_page(item)
+        known_event_ids.add_many(e.id for e in item[1])
+
+    Pipeline(
+        f'{ event_source }_events',
+        fetch_pages,
+        [('parse', parse), ('write', write)],
+        teardown=session.remove,
+    ).run()
+
+
+def _backfill_github_events(event_source, github_api_method, checkpoint_page, last_event_id):
+    # every page is committed together with the checkpoint, so an interrupted
+    # backfill resumes right after the last committed page
+    def fetch_pages():
+        page = checkpoint_page + 1
+        page_last_event_id = last_event_id
+        while True:
+            raw_events = github_api_method(page=page)
+            if not raw_events:
+                break
+            if page_last_event_id is not None:
+                # new events push older ones to later pages, skip the ones
+                # already saved before the checkpoint
+                raw_events = [e for e in raw_events if int(e['id']) < page_last_event_id]
+            if raw_events:
+                page_last_event_id = int(raw_events[-1]['id'])
+            yield page, raw_events, page_last_event_id
+            page += 1
+
+    def write_page(item):
+        page, events, page_last_event_id = item
+        session.merge(GitHubSyncCheckpoint(
             event_source=event_source,
+            page=page,
+            last_event_id=page_last_event_id,
+            completed=False,
         ))
+        if events:
+            write_github_events(event_source, events)
+        else:
+            session.commit()
+        logger.debug(f'backfill checkpoint: page { page }, last event { page_last_event_id }')
+
+    _run_events_pipeline(event_source, fetch_pages, write_page)
+    checkpoint = session.get(GitHubSyncCheckpoint, event_source)
+    if checkpoint is None:
+        # nothing fetched at all
+        checkpoint = GitHubSyncCheckpoint(event_source=event_source, page=0)
+        session.add(checkpoint)
+    checkpoint.completed = True
     session.commit()
 
 
-def _sync_github_events(event_source, github_api_method):
+def _sync_github_events(event_source, github_api_method, restart=False):
+    checkpoint = session.get(GitHubSyncCheckpoint, event_source)
+    if restart and checkpoint:
+        logger.info('Restart the backfill, drop the checkpoint')
+        session.delete(checkpoint)
+        session.commit()
+        checkpoint = None
+
+    if checkpoint and not checkpoint.completed:
+        logger.info(f'Resume the backfill after page { checkpoint.page }...')
+        checkpoint_page, last_event_id = checkpoint.page, checkpoint.last_event_id
+        # the pipeline writes the checkpoint in another session
+        session.commit()
+        _backfill_github_events(event_source, github_api_method, checkpoint_page, last_event_id)
+        return
+
     oldest_event = session.query(GitHubEvent).where(
         GitHubEvent.event_source == event_source).order_by(GitHubEvent.created_at.asc()).first()
     logger.debug(f'Oldest event: { oldest_event.created_at if oldest_event else None }')
 
-    page = 1
-
-    if not oldest_event:
+    if not oldest_event or restart:
         logger.info('No events in the database(should be first call), start to fetch all events...')
+        session.commit()
+        _backfill_github_events(event_source, github_api_method, 0, None)
+        return
+
+    latest_event = session.query(GitHubEvent).where(
+        GitHubEvent.event_source == event_source).order_by(GitHubEvent.created_at.desc()).first()
+    latest_created_at = latest_event.created_at
+    session.commit()
+
+    def fetch_pages():
+        page = 1
         while True:
             raw_events = github_api_method(page=page)
             if not raw_events:
+                # No more events
                 break
-            save_github_events(event_source, raw_events)
-            page += 1
-        return
 
-    while True:
-        latest_event = session.query(GitHubEvent).order_by(GitHubEvent.created_at.desc()).first()
-        raw_events = github_api_method(page=1)
-        if not raw_events:
-            # No more events
-            break
+            if latest_created_at < datetime_from_github_time(raw_events[0]['created_at']):
+                yield page, raw_events
 
-        if latest_event.created_at < datetime_from_github_time(raw_events[0]['created_at']):
-            save_github_events(event_source, raw_events)
+            if latest_created_at < datetime_from_github_time(raw_events[-1]['created_at']):
+                # There are more events
+                page += 1
+            else:
+                logger.debug(f'there are no more events, latest_event: { latest_created_at }')
+                break
 
-        if latest_event.created_at < datetime_from_github_time(raw_events[-1]['created_at']):
-            # There are more events
-            page += 1
-        else:
-            logger.debug(f'there are no more events, latest_event: { latest_event.created_at }')
-            break
+    def write_page(item):
+        page, events = item
+        write_github_events(event_source, events)
+
+    _run_events_pipeline(event_source, fetch_pages, write_page)
+
+
+def _drop_cached_not_found(rows):
+    # rows have repo_id, sha and node_id columns, a NOT_FOUND commit is only
+    # looked up again once its negative cache entry has expired
+    not_found = defaultdict(list)
+    for row in rows:
+        if row.node_id == 'NOT_FOUND':
+            not_found[row.repo_id].append(row.sha)
+    still_not_found = set()
+    for repo_id, shas in not_found.items():
+        for sha, commit in commit_cache.get_many(repo_id, shas).items():
+            if commit['node_id'] == 'NOT_FOUND':
+                still_not_found.add((repo_id, sha))
+    return [
+        row for row in rows
+        if row.node_id != 'NOT_FOUND' or (row.repo_id, row.sha) not in still_not_found
+    ]
 
 
 def _sync_commit_info_for_push_events():
-    while True:
-        push_events = session.query(
-            GitHubEvent.id,
-            GitHubEvent.repo_id,
-            GitHubEvent.repo_name,
-            GitHubEvent.commit_sha
-        ).where(
-            GitHubEvent.event_type == 'PushEvent',
-            GitHubEvent.node_id == None,
-            GitHubEvent.event_source == EventSourceEnum.USER_CREATED.value,
-        ).all()[:50]
-        if not push_events:
-            break
-        event_ids = []
-        repo_commit_shas = defaultdict(lambda: defaultdict(list))
-        for event_id, repo_id, repo_fullname, commit_sha in push_events:
-            event_ids.append(event_id)
-            repo_owner, repo_name = repo_fullname.split('/')
-            repo_commit_shas[repo_id]['owner'] = repo_owner
-            repo_commit_shas[repo_id]['name'] = repo_name
-            repo_commit_shas[repo_id]['shas'].append(commit_sha)
-
-        for commit in graphql_api.get_commits_by_shas(repo_commit_shas):
+    # read pending push events, fetch their commits and write the commit
+    # info concurrently, pending events are read by keyset on the id so the
+    # reader never waits for the writer
+    def read_pending_batches():
+        last_id = None
+        while True:
+            query = session.query(
+                GitHubEvent.id,
+                GitHubEvent.repo_id,
+                GitHubEvent.repo_name,
+                GitHubEvent.commit_sha.label('sha'),
+                GitHubEvent.node_id,
+            ).where(
+                GitHubEvent.event_type == 'PushEvent',
+                sql.or_(GitHubEvent.node_id == None, GitHubEvent.node_id == 'NOT_FOUND'),
+                GitHubEvent.event_source == EventSourceEnum.USER_CREATED.value,
+            )
+            if last_id is not None:
+                query = query.where(GitHubEvent.id > last_id)
+            push_events = query.order_by(GitHubEvent.id).limit(50).all()
+            session.commit()
+            if not push_events:
+                break
+            last_id = push_events[-1][0]
+            push_events = _drop_cached_not_found(push_events)
+            if not push_events:
+                continue
+            repo_commit_shas = defaultdict(lambda: defaultdict(list))
+            for event_id, repo_id, repo_fullname, commit_sha, _ in push_events:
+                repo_owner, repo_name = repo_fullname.split('/')
+                repo_commit_shas[repo_id]['owner'] = repo_owner
+                repo_commit_shas[repo_id]['name'] = repo_name
+                repo_commit_shas[repo_id]['shas'].append(commit_sha)
+            yield repo_commit_shas
+
+    def write_commits(commits):
+        for commit in commits:
             session.query(GitHubEvent).where(
                 GitHubEvent.event_type == 'PushEvent',
                 GitHubEvent.commit_sha == commit['sha'],
@@ -117,82 +314,377 @@ def _sync_commit_info_for_push_events():
                 'node_id': commit['node_id']
             })
         session.commit()
+        queries.invalidate(session, GitHubEvent.__tablename__)
+
+    Pipeline(
+        'push_commit_info',
+        read_pending_batches,
+        [('fetch', graphql_api.get_commits_by_shas), ('write', write_commits)],
+        teardown=session.remove,
+    ).run()
 
     # associate commit with merged pr
-    session.execute(sql.text("""
-        update github_events e1 left join github_events e2
-        on e1.commit_sha = e2.commit_sha and
-            e1.event_type = 'PushEvent' and
-            e2.event_type = 'PullRequestEvent' and
-            e2.action = 'closed'
-        set e1.pr_number = e2.pr_number
-        where e2.id is not null
-    """))
+    if session.get_bind().dialect.name == 'mysql':
+        # mysql can not select from the updated table in a subquery
+        session.execute(sql.text("""
+            update github_events e1 left join github_events e2
+            on e1.commit_sha = e2.commit_sha and
+                e1.event_type = 'PushEvent' and
+                e2.event_type = 'PullRequestEvent' and
+                e2.action = 'closed'
+            set e1.pr_number = e2.pr_number
+            where e2.id is not null
+        """))
+    else:
+        session.execute(sql.text("""
+            update github_events
+            set pr_number = (
+                select e2.pr_number from github_events e2
+                where e2.commit_sha = github_events.commit_sha and
+                    e2.event_type = 'PullRequestEvent' and
+                    e2.action = 'closed'
+                limit 1
+            )
+            where event_type = 'PushEvent' and exists (
+                select 1 from github_events e2
+                where e2.commit_sha = github_events.commit_sha and
+                    e2.event_type = 'PullRequestEvent' and
+                    e2.action = 'closed'
+            )
+        """))
     session.commit()
+    queries.invalidate(session, GitHubEvent.__tablename__)
+
+
+def _sync_push_commits_info():
+    # enrich every commit of the push events in batches, grouped by repo in
+    # a single GraphQL request, then roll the totals up onto the events
+    def read_pending_batches():
+        last_id = None
+        while True:
+            query = session.query(
+                GitHubPushCommit.id,
+                GitHubPushCommit.event_id,
+                GitHubPushCommit.repo_id,
+                GitHubEvent.repo_name,
+                GitHubPushCommit.sha,
+                GitHubPushCommit.node_id,
+            ).join(
+                GitHubEvent, GitHubEvent.id == GitHubPushCommit.event_id
+            ).where(
+                sql.or_(GitHubPushCommit.node_id == None, GitHubPushCommit.node_id == 'NOT_FOUND'),
+                GitHubEvent.event_source == EventSourceEnum.USER_CREATED.value,
+            )
+            if last_id is not None:
+                query = query.where(GitHubPushCommit.id > last_id)
+            push_commits = query.order_by(GitHubPushCommit.id).limit(100).all()
+            session.commit()
+            if not push_commits:
+                break
+            last_id = push_commits[-1][0]
+            push_commits = _drop_cached_not_found(push_commits)
+            if not push_commits:
+                continue
+            event_ids = set()
+            repo_commit_shas = defaultdict(lambda: defaultdict(list))
+            for _, event_id, repo_id, repo_fullname, sha, _ in push_commits:
+                event_ids.add(event_id)
+                repo_owner, repo_name = repo_fullname.split('/')
+                repo_commit_shas[repo_id]['owner'] = repo_owner
+                repo_commit_shas[repo_id]['name'] = repo_name
+                if sha not in repo_commit_shas[repo_id]['shas']:
+                    repo_commit_shas[repo_id]['shas'].append(sha)
+            yield event_ids, repo_commit_shas
+
+    def fetch_commits(item):
+        event_ids, repo_commit_shas = item
+        return event_ids, graphql_api.get_commits_by_shas(repo_commit_shas)
+
+    def write_commits(item):
+        event_ids, commits = item
+        for commit in commits:
+            session.query(GitHubPushCommit).where(
+                GitHubPushCommit.repo_id == commit['repo_id'],
+                GitHubPushCommit.sha == commit['sha'],
+            ).update({
+                'additions': commit['additions'],
+                'deletions': commit['deletions'],
+                'changed_files': commit['changed_files'],
+                'node_id': commit['node_id'],
+            }, synchronize_session=False)
+        # commits which are not distinct were already pushed before, e.g. a
+        # branch fast-forwarded onto main, and count only on their first push
+        distinct = sql.or_(GitHubPushCommit.distinct == None, GitHubPushCommit.distinct == True)
+        totals = session.query(
+            GitHubPushCommit.event_id,
+            func.count(GitHubPushCommit.additions),
+            func.coalesce(func.sum(sql.case((distinct, GitHubPushCommit.additions), else_=0)), 0),
+            func.coalesce(func.sum(sql.case((distinct, GitHubPushCommit.deletions), else_=0)), 0),
+            func.coalesce(func.sum(sql.case((distinct, GitHubPushCommit.changed_files), else_=0)), 0),
+        ).where(
+            GitHubPushCommit.event_id.in_(event_ids)
+        ).group_by(GitHubPushCommit.event_id).all()
+        for event_id, found, additions, deletions, changed_files in totals:
+            if not found:
+                # none of the commits is found, keep the head commit info
+                continue
+            session.query(GitHubEvent).where(GitHubEvent.id == event_id).update({
+                'additions': additions,
+                'deletions': deletions,
+                'changed_files': changed_files,
+            }, synchronize_session=False)
+        session.commit()
+        queries.invalidate(session, GitHubEvent.__tablename__, GitHubPushCommit.__tablename__)
+
+    Pipeline(
+        'push_commits_info',
+        read_pending_batches,
+        [('fetch', fetch_commits), ('write', write_commits)],
+        teardown=session.remove,
+    ).run()
+
+
+def _sync_pr_files_for_push_events():
+    # enrich the pull requests associated with the pushed commits with their
+    # file level stats, each pull request is only fetched once
+    while True:
+        commit_node_ids = [node_id for node_id, in session.query(
+            GitHubEvent.node_id
+        ).where(
+            GitHubEvent.event_type == 'PushEvent',
+            GitHubEvent.node_id != None,
+            GitHubEvent.node_id != 'NOT_FOUND',
+            GitHubEvent.pr_node_id == None,
+            GitHubEvent.event_source == EventSourceEnum.USER_CREATED.value,
+        ).distinct().limit(50).all()]
+        if not commit_node_ids:
+            break
+
+        commits = graphql_api.get_commits_by_node_ids(commit_node_ids)
+        pr_node_ids = set()
+        for commit in commits:
+            if commit:
+                pr_node_ids.update(pr['id'] for pr in commit['associatedPullRequests']['nodes'])
+        enriched_pr_node_ids = {pr_node_id for pr_node_id, in session.query(
+            GitHubPullRequestFile.pr_node_id
+        ).where(
+            GitHubPullRequestFile.pr_node_id.in_(pr_node_ids)
+        ).distinct()}
+
+        for commit_node_id, commit in zip(commit_node_ids, commits):
+            prs = commit['associatedPullRequests']['nodes'] if commit else []
+            pr = prs[0] if prs else None
+            session.query(GitHubEvent).where(
+                GitHubEvent.event_type == 'PushEvent',
+                GitHubEvent.node_id == commit_node_id,
+            ).update({
+                'pr_node_id': pr['id'] if pr else 'NOT_FOUND'
+            })
+            if not pr or pr['id'] in enriched_pr_node_ids:
+                continue
+
+            files = pr['files']
+            while True:
+                for f in files['nodes']:
+                    session.add(GitHubPullRequestFile(
+                        pr_node_id=pr['id'],
+                        pr_number=pr['number'],
+                        repo_id=commit['repository']['databaseId'],
+                        path=f['path'],
+                        additions=f['additions'],
+                        deletions=f['deletions'],
+                    ))
+                if not files['pageInfo']['hasNextPage']:
+                    break
+                files = graphql_api.get_pull_request_files(
+                    pr['id'], after=files['pageInfo']['endCursor'])
+            enriched_pr_node_ids.add(pr['id'])
+        session.commit()
+        queries.invalidate(session, GitHubEvent.__tablename__)
 
 
-def sync_user_created_events():
+def sync_user_created_events(restart=False):
     logger.info('🚀 Syncing user created events...')
     _sync_github_events(
         EventSourceEnum.USER_CREATED.value,
         rest_api.get_authenticated_user_created_events,
+        restart=restart,
     )
-    _sync_commit_info_for_push_events()
     logger.info(f'🎉 Syncing user created events done! 🎉')
 
 
-def sync_user_received_events():
+def sync_push_commit_info():
+    logger.info('🚀 Syncing commit info for push events...')
+    _sync_commit_info_for_push_events()
+    _sync_push_commits_info()
+    _sync_pr_files_for_push_events()
+    logger.info(f'🎉 Syncing commit info for push events done! 🎉')
+
+
+def sync_user_received_events(restart=False):
     logger.info('🚀 Syncing user received events...')
     _sync_github_events(
         EventSourceEnum.USER_RECEIVED.value,
         rest_api.get_authenticated_user_received_events,
+        restart=restart,
     )
     logger.info(f'🎉 Syncing user received events done! 🎉')
 
 
+USER_STATS_COLUMNS = (
+    'company', 'follower_count', 'following_count', 'starred_count',
+    'repo_count', 'public_repo_count', 'public_gist_count',
+)
+
+
+def _load_last_user_stats(user_id):
+    last = session.query(GitHubUserStats).where(
+        GitHubUserStats.user_id == user_id
+    ).order_by(GitHubUserStats.created_at.desc()).first()
+    if not last:
+        return None
+    return {c: getattr(last, c) for c in USER_STATS_COLUMNS}, last.created_at
+
+
+def _load_last_dynamic_stats(dimension, value_column):
+    last = session.query(GitHubUserDynamicStats).where(
+        GitHubUserDynamicStats.dimension == dimension
+    ).order_by(GitHubUserDynamicStats.created_at.desc()).first()
+    if not last:
+        return None
+    return getattr(last, value_column), last.created_at
+
+
 def sycn_user_stats():
     logger.info('🚀 Syncing user stats...')
     data = graphql_api.get_user_stats()
     user_id = data['databaseId']
     user_login = data['login']
-    session.add(GitHubUserStats(
+    stats = {
+        'company': data['company'],
+        'follower_count': data['followers']['totalCount'],
+        'following_count': data['following']['totalCount'],
+        'starred_count': data['starredRepositories']['totalCount'],
+        'repo_count': data['repos']['totalCount'],
+        'public_repo_count': data['publicRepos']['totalCount'],
+        'public_gist_count': data['publicGists']['totalCount'],
+    }
+    key = ('user_stats', user_id)
+    if not stats_change_detector.should_write(key, stats, lambda: _load_last_user_stats(user_id)):
+        logger.info('🎉 User stats not changed, skip writing 🎉')
+        return
+    user_stats = GitHubUserStats(
         user_id=user_id,
         user_login=user_login,
-        company=data['company'],
-        follower_count=data['followers']['totalCount'],
-        following_count=data['following']['totalCount'],
-        starred_count=data['starredRepositories']['totalCount'],
-        repo_count=data['repos']['totalCount'],
-        public_repo_count=data['publicRepos']['totalCount'],
-        public_gist_count=data['publicGists']['totalCount'],
-    ))
+        created_at=datetime.utcnow(),
+        **stats,
+    )
+    session.add(user_stats)
     session.commit()
+    queries.invalidate(session, GitHubUserStats.__tablename__)
+    stats_change_detector.written(key, stats, user_stats.created_at)
     logger.info('🎉 Syncing user stats done! 🎉')
 
 
+def _save_dynamic_stats(dimension, **value):
+    # value is one of int_value, str_value or json_value
+    (value_column, value), = value.items()
+    key = ('dynamic_stats', dimension)
+    if not stats_change_detector.should_write(
+            key, value, lambda: _load_last_dynamic_stats(dimension, value_column)):
+        logger.debug(f'{ dimension } not changed, skip writing')
+        return None
+    stats = GitHubUserDynamicStats(
+        dimension=dimension,
+        created_at=datetime.utcnow(),
+        **{value_column: value},
+    )
+    session.add(stats)
+    return lambda: stats_change_detector.written(key, value, stats.created_at)
+
+
 def sync_billing_stats():
     logger.info('🚀 Syncing billing stats...')
     data = rest_api.get_github_action_usage()
-    session.add(GitHubUserDynamicStats(
-        dimension='total_minutes_used',
-        int_value=data['total_minutes_used']
-    ))
-    session.add(GitHubUserDynamicStats(
-        dimension='total_paid_minutes_used',
-        int_value=data['total_paid_minutes_used']
-    ))
-    session.add(GitHubUserDynamicStats(
-        dimension='minutes_used_breakdown',
-        json_value=data['minutes_used_breakdown']
-    ))
+    written_callbacks = [
+        _save_dynamic_stats('total_minutes_used', int_value=data['total_minutes_used']),
+        _save_dynamic_stats('total_paid_minutes_used', int_value=data['total_paid_minutes_used']),
+    ]
+    for runner, minutes in data['minutes_used_breakdown'].items():
+        written_callbacks.append(
+            _save_dynamic_stats(billing_breakdown_dimension(runner), int_value=minutes)
+        )
     session.commit()
+    queries.invalidate(session, GitHubUserDynamicStats.__tablename__)
+    for callback in written_callbacks:
+        if callback:
+            callback()
     logger.info('🎉 Syncing billing stats done! 🎉')
 
 
+def backfill_billing_stats():
+    logger.info('🚀 Exploding billing breakdown JSON rows...')
+    backfill_billing_breakdown(session)
+    queries.invalidate(session, GitHubUserDynamicStats.__tablename__)
+    logger.info('🎉 Exploding billing breakdown JSON rows done! 🎉')
+
+
+def reparse_github_events(chunk_size, workers, throttle):
+    logger.info('🚀 Reparsing stored github events...')
+    reparse_events(session, chunk_size=chunk_size, workers=workers, throttle=throttle)
+    queries.invalidate(session, GitHubEvent.__tablename__, GitHubPushCommit.__tablename__)
+    logger.info('🎉 Reparsing stored github events done! 🎉')
+
+
+def compact_user_stats(granularity):
+    logger.info(f'🚀 Compacting user stats to { granularity } points...')
+    compact_stats(session, granularity)
+    queries.invalidate(session, GitHubUserStats.__tablename__, GitHubUserDynamicStats.__tablename__)
+    logger.info('🎉 Compacting user stats done! 🎉')
+
+
+def serve_webhooks():
+    host = env.str('WEBHOOK_HOST', '0.0.0.0')
+    port = env.int('WEBHOOK_PORT', 8080)
+
+    def save(raw_events):
+        try:
+            save_github_events(EventSourceEnum.WEBHOOK.value, raw_events)
+        finally:
+            session.remove()
+
+    batcher = WebhookEventBatcher(
+        save,
+        batch_size=env.int('WEBHOOK_BATCH_SIZE', 100),
+        flush_interval=env.float('WEBHOOK_FLUSH_INTERVAL', 5),
+    )
+    server = create_webhook_server(host, port, env.str('WEBHOOK_SECRET'), batcher)
+    batcher.start()
+    logger.info(f'🚀 Receiving webhooks on { host }:{ port }...')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+    logger.info('🎉 Webhook receiver stopped 🎉')
+
+
+def _task_wrapper(name, func):
+    def run():
+        try:
+            with profiling.profile_task(name):
+                func()
+        finally:
+            session.remove()
+    return run
+
+
 def main():
     logging.basicConfig(
         level=logging.DEBUG if DEBUG else logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        format='%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s'
     )
 
     parser = argparse.ArgumentParser(prog='my_github events sync tools')
@@ -200,20 +692,129 @@ def main():
     parser.add_argument('--sync-user-received-events', action='store_true')
     parser.add_argument('--sync-user-stats', action='store_true')
     parser.add_argument('--sync-billing-stats', action='store_true')
+    parser.add_argument(
+        '--backfill-billing-breakdown', action='store_true',
+        help='Explode the stored minutes_used_breakdown JSON rows into per runner rows'
+    )
+    parser.add_argument(
+        '--reparse-events', action='store_true',
+        help='Re-derive the columns of the stored events from their payload'
+    )
+    parser.add_argument('--reparse-chunk-size', type=int, default=1000)
+    parser.add_argument(
+        '--reparse-workers', type=int, default=None,
+        help='Number of parser processes, defaults to the number of CPUs'
+    )
+    parser.add_argument(
+        '--reparse-throttle', type=float, default=0.0,
+        help='Seconds to sleep between chunks'
+    )
+    parser.add_argument(
+        '--compact-stats', choices=list(COMPACT_GRANULARITIES),
+        help='Downsample the stored user stats history to hourly or daily points'
+    )
+    parser.add_argument(
+        '--serve-webhooks', action='store_true',
+        help='Run a webhook receiver which saves the received events, blocks until interrupted'
+    )
+    parser.add_argument(
+        '--task-timeout', type=int, default=None,
+        help='Timeout of every sync task in seconds'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='Write a CPU profile (.prof, for snakeviz/flameprof) and a '
+        'busy time summary of every task to --profile-dir'
+    )
+    parser.add_argument('--profile-dir', default='profiles')
+    parser.add_argument(
+        '--slow-sql-ms', type=int, default=None,
+        help='Log the SQL statements slower than this many milliseconds'
+    )
+    backfill_group = parser.add_mutually_exclusive_group()
+    backfill_group.add_argument(
+        '--resume', dest='restart', action='store_false',
+        help='Resume an interrupted events backfill from its checkpoint (default)'
+    )
+    backfill_group.add_argument(
+        '--restart', dest='restart', action='store_true',
+        help='Drop the events backfill checkpoint and backfill from the first page'
+    )
+    # both flags share the dest, set the default explicitly or argparse takes
+    # the one of the store_false action
+    parser.set_defaults(restart=False)
     args = parser.parse_args(args=None if sys.argv[1:] else ['--help'])
     args = parser.parse_args()
+    setup()
 
+    tasks = []
     if args.sync_user_created_events:
-        sync_user_created_events()
+        tasks.append(Task(
+            'user_created_events', functools.partial(sync_user_created_events, restart=args.restart)
+        ))
+        tasks.append(Task(
+            'push_commit_info', sync_push_commit_info,
+            depends_on=['user_created_events']
+        ))
 
     if args.sync_user_received_events:
-        sync_user_received_events()
+        tasks.append(Task(
+            'user_received_events', functools.partial(sync_user_received_events, restart=args.restart)
+        ))
 
     if args.sync_user_stats:
-        sycn_user_stats()
+        tasks.append(Task('user_stats', sycn_user_stats))
 
     if args.sync_billing_stats:
-        sync_billing_stats()
+        tasks.append(Task('billing_stats', sync_billing_stats))
+
+    if args.reparse_events:
+        tasks.append(Task('reparse_events', functools.partial(
+            reparse_github_events,
+            args.reparse_chunk_size, args.reparse_workers, args.reparse_throttle
+        )))
+
+    if args.backfill_billing_breakdown:
+        tasks.append(Task('backfill_billing_breakdown', backfill_billing_stats))
+
+    if args.compact_stats:
+        # compact after the new stats are written
+        stats_tasks = [
+            t.name for t in tasks
+            if t.name in ('user_stats', 'billing_stats', 'backfill_billing_breakdown')
+        ]
+        tasks.append(Task(
+            'compact_stats', functools.partial(compact_user_stats, args.compact_stats),
+            depends_on=stats_tasks
+        ))
+
+    for task in tasks:
+        task.func = _task_wrapper(task.name, task.func)
+        task.timeout = args.task_timeout
+
+    if args.profile:
+        profiling.profiler.enable(args.profile_dir)
+    if args.profile or args.slow_sql_ms is not None:
+        profiling.instrument_engine(session.get_bind(), slow_sql_ms=args.slow_sql_ms)
+
+    max_workers = None
+    if args.profile and not profiling.PER_THREAD_PROFILES:
+        logger.warning(
+            'Profiles can not be per thread on this python, the tasks run one at a time '
+            'to get a CPU profile each'
+        )
+        max_workers = 1
+    results = TaskRunner(tasks, max_workers=max_workers).run()
+    for result in results:
+        logger.info(f'Task { result.name }: { result.status.value } in { round(result.elapsed, 1) }s')
+    if args.profile:
+        profiling.profiler.write_results()
+
+    if args.serve_webhooks:
+        serve_webhooks()
+
+    if not all(result.ok for result in results):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -72,20 +72,24 @@ def run_migrations_online() -> None:
     #         }
     #     }
     # )
+    database_url = env.str('DB_URL')
+    is_sqlite = database_url.startswith('sqlite')
     connectable = create_engine(
-        env.str('DB_URL'),
+        database_url,
         poolclass=pool.NullPool,
         _coerce_config=True,
         connect_args={
             'ssl': {
                 'ca': '/etc/ssl/cert.pem'
             }
-        } if env.bool('DB_USE_SSL', True) else {}
+        } if env.bool('DB_USE_SSL', True) and not is_sqlite else {}
     )
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            # sqlite can not alter most of the table definitions in place
+            render_as_batch=is_sqlite
         )
 
         with context.begin_transaction():
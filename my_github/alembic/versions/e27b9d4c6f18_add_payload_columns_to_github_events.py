@@ -0,0 +1,95 @@
+"""add payload columns to github_events, full-text index github_push_commits.message
+
+Revision ID: e27b9d4c6f18
+Revises: a6f3c8e15b90
+Create Date: 2026-10-19 16:05:37.418260
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e27b9d4c6f18'
+down_revision = 'a6f3c8e15b90'
+branch_labels = None
+depends_on = None
+
+
+def _mysql_string(path, length):
+    value = f"JSON_EXTRACT(payload, '$.{ path }')"
+    return f"CASE WHEN JSON_TYPE({ value }) = 'STRING' THEN LEFT(JSON_UNQUOTE({ value }), { length }) END"
+
+
+def _mysql_integer(path):
+    value = f"JSON_EXTRACT(payload, '$.{ path }')"
+    return f"CASE WHEN JSON_TYPE({ value }) IN ('INTEGER', 'UNSIGNED INTEGER') THEN CAST({ value } AS SIGNED) END"
+
+
+def _postgresql_path(path):
+    return 'payload' + ''.join(f" -> '{ key }'" for key in path.split('.'))
+
+
+def _postgresql_string(path, length):
+    value = _postgresql_path(path)
+    return f"CASE WHEN json_typeof({ value }) = 'string' THEN left(({ value }) #>> '{{}}', { length }) END"
+
+
+def _postgresql_integer(path):
+    value = _postgresql_path(path)
+    return f"CASE WHEN json_typeof({ value }) = 'number' THEN (({ value }) #>> '{{}}')::integer END"
+
+
+def _payload_columns(dialect):
+    # [(name, type, generated expression or None)], keep in sync with
+    # my_github.event_parser.PAYLOAD_COLUMNS
+    columns = [
+        ('pr_title', sa.String(length=512), 'string', 'pull_request.title', 512),
+        ('ref', sa.String(length=255), 'string', 'ref', 255),
+        ('issue_number', sa.Integer(), 'integer', 'issue.number', None),
+    ]
+    result = []
+    for name, type_, kind, path, length in columns:
+        if dialect == 'mysql':
+            expression = _mysql_string(path, length) if kind == 'string' else _mysql_integer(path)
+        elif dialect == 'postgresql':
+            expression = _postgresql_string(path, length) if kind == 'string' else _postgresql_integer(path)
+        else:
+            # e.g. SQLite can not add a stored generated column to an
+            # existing table, EventParser fills a plain column instead and
+            # `main.py --reparse-events` backfills the stored events
+            expression = None
+        result.append((name, type_, expression))
+    return result
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    with op.batch_alter_table('github_events') as batch_op:
+        for name, type_, expression in _payload_columns(dialect):
+            if expression is None:
+                batch_op.add_column(sa.Column(name, type_, nullable=True))
+            else:
+                batch_op.add_column(sa.Column(name, type_, sa.Computed(expression, persisted=True), nullable=True))
+    for name, _, _ in _payload_columns(dialect):
+        op.create_index(f'ix_github_events_{ name }', 'github_events', [name], unique=False)
+
+    if dialect == 'mysql':
+        op.create_index('ix_github_push_commits_message', 'github_push_commits', ['message'], mysql_prefix='FULLTEXT')
+    elif dialect == 'postgresql':
+        op.create_index(
+            'ix_github_push_commits_message', 'github_push_commits',
+            [sa.text("to_tsvector('english', coalesce(message, ''))")],
+            postgresql_using='gin',
+        )
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect in ('mysql', 'postgresql'):
+        op.drop_index('ix_github_push_commits_message', table_name='github_push_commits')
+    for name, _, _ in reversed(_payload_columns(dialect)):
+        op.drop_index(f'ix_github_events_{ name }', table_name='github_events')
+    with op.batch_alter_table('github_events') as batch_op:
+        for name, _, _ in reversed(_payload_columns(dialect)):
+            batch_op.drop_column(name)
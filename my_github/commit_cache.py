@@ -0,0 +1,84 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class CommitCache:
+    """Local persistent cache of commit lookups keyed by repo id and sha.
+
+    Commit stats never change, so resolved commits are cached forever. Commits
+    that can not be resolved (deleted or private repos) are cached as negative
+    entries which expire after `negative_ttl` seconds.
+    """
+
+    def __init__(self, path, negative_ttl=7 * 24 * 3600):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            create table if not exists commits (
+                repo_id integer not null,
+                sha text not null,
+                found integer not null,
+                value text,
+                cached_at real not null,
+                primary key (repo_id, sha)
+            )
+        """)
+        self._conn.commit()
+
+    def get_many(self, repo_id, shas):
+        # returns {sha: commit} for the cached shas, a negative entry is
+        # returned as a commit with node_id NOT_FOUND
+        if not shas:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(shas))
+        with self._lock:
+            rows = self._conn.execute(
+                f'select sha, found, value, cached_at from commits '
+                f'where repo_id = ? and sha in ({ placeholders })',
+                [repo_id, *shas]
+            ).fetchall()
+        commits = {}
+        for sha, found, value, cached_at in rows:
+            if found:
+                commits[sha] = json.loads(value)
+            elif now - cached_at < self.negative_ttl:
+                commits[sha] = not_found_commit(repo_id, sha)
+        return commits
+
+    def put_many(self, commits):
+        now = time.time()
+        rows = []
+        for commit in commits:
+            found = commit['node_id'] != 'NOT_FOUND'
+            rows.append((
+                commit['repo_id'], commit['sha'], int(found),
+                json.dumps(commit) if found else None, now
+            ))
+        with self._lock:
+            self._conn.executemany(
+                'insert or replace into commits (repo_id, sha, found, value, cached_at) '
+                'values (?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def not_found_commit(repo_id, sha):
+    return {
+        'repo_id': repo_id,
+        'node_id': 'NOT_FOUND',
+        'sha': sha,
+        'additions': None,
+        'deletions': None,
+        'changed_files': None
+    }
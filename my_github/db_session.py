@@ -1,21 +1,97 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.orm.session import Session
 
 
-def create_session(
+def is_sqlite(database_url: str) -> bool:
+    return database_url.startswith('sqlite')
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers work while a writer commits, busy_timeout makes
+    # concurrent writers wait for each other instead of failing
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=30000')
+    cursor.close()
+
+
+def create_session_factory(
         database_url: str,
         echo: bool = False,
         use_ssl: bool = False,
-        ssl_ca_path: str = '/etc/ssl/cert.pem') -> Session:
+        ssl_ca_path: str = '/etc/ssl/cert.pem') -> sessionmaker:
     connect_args = {}
-    if use_ssl:
+    if use_ssl and not is_sqlite(database_url):
         connect_args['ssl'] = {
             "ca": ssl_ca_path
         }
+    if is_sqlite(database_url):
+        # the sessions of the sync tasks live in different threads
+        connect_args['check_same_thread'] = False
     engine = create_engine(
         database_url,
         echo=echo, connect_args=connect_args
     )
-    Session = sessionmaker(bind=engine)
+    if is_sqlite(database_url):
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+    return sessionmaker(bind=engine)
+
+
+def create_session(
+        database_url: str,
+        echo: bool = False,
+        use_ssl: bool = False,
+        ssl_ca_path: str = '/etc/ssl/cert.pem') -> Session:
+    Session = create_session_factory(database_url, echo, use_ssl, ssl_ca_path)
     return Session()
+
+
+def create_scoped_session(
+        database_url: str,
+        echo: bool = False,
+        use_ssl: bool = False,
+        ssl_ca_path: str = '/etc/ssl/cert.pem') -> scoped_session:
+    # every thread gets its own session, call `remove()` when the thread is done
+    Session = create_session_factory(database_url, echo, use_ssl, ssl_ca_path)
+    return scoped_session(Session)
+
+
+def upsert(session, model, rows, batch_size=500):
+    # insert the rows, or update the given columns of the rows which already
+    # exist, columns missing from a row are kept as is
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    table = model.__table__
+    primary_keys = [c.name for c in table.primary_key]
+
+    # a statement needs the same columns in every row
+    rows_by_columns = {}
+    for row in rows:
+        rows_by_columns.setdefault(tuple(sorted(row)), []).append(row)
+
+    for columns, same_column_rows in rows_by_columns.items():
+        update_columns = [c for c in columns if c not in primary_keys]
+        for i in range(0, len(same_column_rows), batch_size):
+            batch = same_column_rows[i:i + batch_size]
+            if dialect == 'mysql':
+                from sqlalchemy.dialects.mysql import insert
+                stmt = insert(table).values(batch)
+                stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_columns})
+            elif dialect in ('sqlite', 'postgresql'):
+                if dialect == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert
+                else:
+                    from sqlalchemy.dialects.postgresql import insert
+                stmt = insert(table).values(batch)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=primary_keys,
+                    set_={c: stmt.excluded[c] for c in update_columns},
+                )
+            else:
+                for row in batch:
+                    session.merge(model(**row))
+                continue
+            session.execute(stmt)
@@ -0,0 +1,51 @@
+import bisect
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+from my_github.models import GitHubEvent
+
+# the events API only returns the events of the last 90 days
+# https://docs.github.com/en/rest/activity/events?apiVersion=2022-11-28
+EVENTS_API_WINDOW = timedelta(days=90)
+
+
+class KnownEventIds:
+    """A compact sorted array of the event ids already stored.
+
+    Used to drop the already stored events of a page before parsing and
+    writing them.
+    """
+
+    def __init__(self, ids=()):
+        self._ids = array('q', sorted(ids))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, session, event_source, window=EVENTS_API_WINDOW):
+        # only the ids the events API can still return are loaded
+        ids = session.query(GitHubEvent.id).where(
+            GitHubEvent.event_source == event_source,
+            GitHubEvent.created_at >= datetime.utcnow() - window,
+        ).order_by(GitHubEvent.id)
+        return cls(event_id for event_id, in ids)
+
+    def __contains__(self, event_id):
+        event_id = int(event_id)
+        with self._lock:
+            i = bisect.bisect_left(self._ids, event_id)
+            return i < len(self._ids) and self._ids[i] == event_id
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add_many(self, event_ids):
+        with self._lock:
+            for event_id in event_ids:
+                event_id = int(event_id)
+                i = bisect.bisect_left(self._ids, event_id)
+                if i == len(self._ids) or self._ids[i] != event_id:
+                    self._ids.insert(i, event_id)
+
+    def filter_new(self, raw_events):
+        return [e for e in raw_events if e['id'] not in self]
@@ -11,10 +11,38 @@ class ACTION_ENUM(enum.Enum):
     ADDED = 'added'
 
 
+# payload fields searched often enough to get their own indexed column,
+# {column: (payload path, type, max length)}. They are generated columns on
+# the dialects in event_store.GENERATED_COLUMN_DIALECTS, EventParser fills
+# them everywhere else
+PAYLOAD_COLUMNS = {
+    'pr_title': (('pull_request', 'title'), str, 512),
+    'ref': (('ref',), str, 255),
+    'issue_number': (('issue', 'number'), int, None),
+}
+
+
+def payload_value(payload, path, value_type, max_length=None):
+    # the same value as the generated column: None unless the path holds a
+    # value of the type, strings truncated to the length of the column
+    value = payload
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    if not isinstance(value, value_type) or isinstance(value, bool):
+        return None
+    if max_length is not None:
+        value = value[:max_length]
+    return value
+
+
 class EventParser:
     def __init__(self, raw_event):
         self.raw_event = raw_event
         self.event_dict = dict()
+        # the commits of a PushEvent, stored in github_push_commits
+        self.push_commits = []
         self.transform()
     
     def transform(self):
@@ -34,13 +62,23 @@ class EventParser:
             'action': e['payload'].get('action'),
             'created_at': datetime.strptime(e['created_at'], '%Y-%m-%dT%H:%M:%SZ')
         }
+        for column, (path, value_type, max_length) in PAYLOAD_COLUMNS.items():
+            self.event_dict[column] = payload_value(e['payload'], path, value_type, max_length)
         transform_method = f'transform_{ e["type"] }'.lower()
         if hasattr(self, transform_method):
             e = getattr(self, transform_method)()
             self.event_dict.update(e)
     
     def transform_pushevent(self):
-        self.event_dict['commit_sha'] = self.raw_event['payload']['head']
+        payload = self.raw_event['payload']
+        self.event_dict['commit_sha'] = payload['head']
+        self.push_commits = [{
+            'sha': c['sha'],
+            'author_name': c.get('author', {}).get('name'),
+            'author_email': c.get('author', {}).get('email'),
+            'message': c.get('message'),
+            'distinct': c.get('distinct'),
+        } for c in payload.get('commits') or []]
         return {}
 
     def transform_pullrequestevent(self):
@@ -53,7 +91,7 @@ class EventParser:
             'deletions': pr_info['deletions'],
             'changed_files': pr_info['changed_files'],
         }
-        if self.action == ACTION_ENUM.CLOSED:
+        if self.action == ACTION_ENUM.CLOSED.value:
             _e['commit_sha'] = pr_info['merge_commit_sha']
         return _e
     
@@ -0,0 +1,42 @@
+from my_github.event_parser import PAYLOAD_COLUMNS
+from my_github.models import GitHubPushCommit
+
+# the dialects on which the payload columns of github_events are generated
+# columns, which the database computes and refuses writes to
+GENERATED_COLUMN_DIALECTS = ('mysql', 'postgresql')
+
+
+def has_generated_payload_columns(session):
+    return session.get_bind().dialect.name in GENERATED_COLUMN_DIALECTS
+
+
+def writable_event_rows(session, rows):
+    # drop the payload columns from the github_events rows if the database
+    # generates them
+    if not has_generated_payload_columns(session):
+        return rows
+    return [{k: v for k, v in row.items() if k not in PAYLOAD_COLUMNS} for row in rows]
+
+
+def add_push_commits(session, push_commits):
+    # push_commits is a list of (event_id, repo_id, commits), the commits
+    # already stored for an event are skipped
+    push_commits = [(int(event_id), repo_id, commits) for event_id, repo_id, commits in push_commits if commits]
+    if not push_commits:
+        return 0
+    stored = set(session.query(GitHubPushCommit.event_id, GitHubPushCommit.sha).where(
+        GitHubPushCommit.event_id.in_([event_id for event_id, _, _ in push_commits])
+    ))
+    added = 0
+    for event_id, repo_id, commits in push_commits:
+        for commit in commits:
+            if (event_id, commit['sha']) in stored:
+                continue
+            stored.add((event_id, commit['sha']))
+            session.add(GitHubPushCommit(
+                event_id=event_id,
+                repo_id=repo_id,
+                **commit,
+            ))
+            added += 1
+    return added
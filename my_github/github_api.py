@@ -2,6 +2,10 @@ import logging
 import requests
 from datetime import datetime
 
+from my_github.commit_cache import not_found_commit
+from my_github.profiling import timed
+from my_github.transport import TransportConfig, is_timeout
+
 
 class GitHubAPIException(Exception):
     pass
@@ -13,24 +17,31 @@ class GithubAPITimeout(GitHubAPIException):
 
 class GitHubRestAPI:
 
-    def __init__(self, username, token):
+    def __init__(self, username, token, transport=None):
         self.username = username
         self.token = token
-        self.request_session = requests.Session()
-        self.request_session.headers.update({
+        self.transport = transport or TransportConfig()
+        self._sessions = self.transport.create_sessions({
             'Accept': 'application/vnd.github+json',
             'Authorization': f'Bearer {self.token}',
             'X-GitHub-Api-Version': '2022-11-28'
         })
 
+    @property
+    def request_session(self):
+        return self._sessions.get()
+
     def do_request(self, method, url, params=None, body=None):
         try:
-            response = self.request_session.request(
-                method=method, url=url, params=params, data=body,
-                timeout=10
-            )
-        except requests.exceptions.Timeout:
-            raise GithubAPITimeout('GitHub API timeout')
+            with timed('http'):
+                response = self.request_session.request(
+                    method=method, url=url, params=params, data=body,
+                    timeout=self.transport.timeout
+                )
+        except requests.exceptions.RequestException as e:
+            if is_timeout(e):
+                raise GithubAPITimeout('GitHub API timeout')
+            raise GitHubAPIException(f'GitHub API request error: { e }')
 
         return response
 
@@ -44,13 +55,10 @@ class GitHubRestAPI:
                 'per_page': per_page
             }
         )
-        if response.status_code >= 500:
-            logging.error(f'Error: { response.status_code }')
-            return []
-        elif response.status_code == 422:
+        if response.status_code == 422:
             # There is no more events
             return []
-        return response.json()
+        return handle_response(response)
 
     def get_authenticated_user_received_events(self, page=1, per_page=100):
         # https://docs.github.com/en/rest/activity/events?apiVersion=2022-11-28#list-events-for-the-authenticated-user
@@ -62,13 +70,10 @@ class GitHubRestAPI:
                 'per_page': per_page
             }
         )
-        if response.status_code >= 500:
-            logging.error(f'Error: { response.status_code }')
-            return []
-        elif response.status_code == 422:
+        if response.status_code == 422:
             # There is no more events
             return []
-        return response.json()
+        return handle_response(response)
 
     def get_github_action_usage(self):
         # https://docs.github.com/en/rest/billing?apiVersion=2022-11-28#get-github-actions-billing-for-a-user
@@ -76,6 +81,20 @@ class GitHubRestAPI:
             method='GET',
             url=f'https://api.github.com/users/{ self.username }/settings/billing/actions'
         )
+        return handle_response(response)
+
+
+def handle_response(response, exception_class=GitHubAPIException):
+    # the retries of the transport are used up when an error status gets here
+    if 200 <= response.status_code < 300:
+        return decode_json(response)
+    raise exception_class(
+        f'GitHub API error, status code: { response.status_code }, url: { response.url }'
+    )
+
+
+def decode_json(response):
+    with timed('json_decode'):
         return response.json()
 
 
@@ -89,32 +108,36 @@ class GraphQLException(GitHubAPIException):
 
 class GitHubGraphQLAPI:
 
-    def __init__(self, username, token):
+    def __init__(self, username, token, commit_cache=None, transport=None):
         self.username = username
         self.token = token
-        self.request_session = requests.Session()
-        self.request_session.headers.update({
-            'Authorization': f'Bearer {self.token}'
-        })
+        self.commit_cache = commit_cache
+        self.transport = transport or TransportConfig()
+        # the queries only read, so a POST is as safe to retry as a GET
+        self._sessions = self.transport.create_sessions(
+            {'Authorization': f'Bearer {self.token}'}, retry_methods=('POST',)
+        )
+
+    @property
+    def request_session(self):
+        return self._sessions.get()
 
     def do_request(self, query, variables=None):
         # send graphql request to github
         try:
-            response = self.request_session.post(
-                'https://api.github.com/graphql',
-                json={
-                    'query': query,
-                    'variables': variables
-                },
-                timeout=10
-            )
+            with timed('http'):
+                response = self.request_session.post(
+                    'https://api.github.com/graphql',
+                    json={
+                        'query': query,
+                        'variables': variables
+                    },
+                    timeout=self.transport.timeout
+                )
         except requests.exceptions.RequestException as e:
             raise GraphQLException(f'GitHub graphql request error: { e }')
 
-        if response.status_code == 200:
-            return response.json()
-
-        raise GraphQLException(f'Github graphql error, status code: { response.status_code }')
+        return handle_response(response, GraphQLException)
 
     def get_rate_limit(self):
         query = """
@@ -158,17 +181,21 @@ query {
         """
         return self.do_request(query=query, variables=None)['data']['viewer']
 
-    def get_commits_by_node_ids(self, commits):
+    def get_commits_by_node_ids(self, commits, first=100):
+        # returns the commit nodes in the same order as the given node ids,
+        # a node is None if it can not be resolved
         query = """
 query getCommits($ids: [ID!]!, $first: Int!) {
   nodes(ids: $ids) {
     ... on Commit {
+      id
       oid
       additions
       deletions
       changedFiles
       repository {
         id
+        databaseId
         name
         owner {
           login
@@ -178,10 +205,16 @@ query getCommits($ids: [ID!]!, $first: Int!) {
       }
       associatedPullRequests(first: 1) {
         nodes {
+          id
+          number
           changedFiles
           additions
           deletions
           files(first: $first) {
+            pageInfo {
+              hasNextPage
+              endCursor
+            }
             nodes {
               path
               additions
@@ -196,9 +229,36 @@ query getCommits($ids: [ID!]!, $first: Int!) {
         """
         variables = {
             'ids': commits,
-            'first': 100
+            'first': first
         }
-        return self.do_request(query=query, variables=variables)
+        return self.do_request(query=query, variables=variables)['data']['nodes']
+
+    def get_pull_request_files(self, pr_node_id, after=None, first=100):
+        query = """
+query getPullRequestFiles($id: ID!, $first: Int!, $after: String) {
+  node(id: $id) {
+    ... on PullRequest {
+      files(first: $first, after: $after) {
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        nodes {
+          path
+          additions
+          deletions
+        }
+      }
+    }
+  }
+}
+        """
+        variables = {
+            'id': pr_node_id,
+            'first': first,
+            'after': after
+        }
+        return self.do_request(query=query, variables=variables)['data']['node']['files']
 
     def get_commits_by_shas(self, commit_shas):
         # commit_shas should be organized by repo as follows:
@@ -209,6 +269,28 @@ query getCommits($ids: [ID!]!, $first: Int!) {
         #         'shas': ['sha1', 'sha2', 'sha3']
         #     }
         # }
+        if self.commit_cache is None:
+            return self._query_commits_by_shas(commit_shas)
+
+        commits = []
+        uncached_commit_shas = {}
+        for repo_id, repo in commit_shas.items():
+            cached = self.commit_cache.get_many(repo_id, repo['shas'])
+            commits.extend(cached.values())
+            shas = [sha for sha in repo['shas'] if sha not in cached]
+            if shas:
+                uncached_commit_shas[repo_id] = {**repo, 'shas': shas}
+        logging.debug(f'{ len(commits) } commits hit the commit cache')
+        if not uncached_commit_shas:
+            return commits
+
+        fetched_commits = self._query_commits_by_shas(uncached_commit_shas)
+        self.commit_cache.put_many(fetched_commits)
+        return commits + fetched_commits
+
+    def _query_commits_by_shas(self, commit_shas):
+        # the commits of repos that failed with other errors than NOT_FOUND
+        # (e.g. rate limit, forbidden) are left out, they may resolve later
         query = 'query {'
         for repo_id, repo in commit_shas.items():
             repo_owner = repo['owner']
@@ -232,32 +314,28 @@ query getCommits($ids: [ID!]!, $first: Int!) {
             }}
             """
         query += '}'
-        data = self.do_request(query=query, variables=None)['data']
+        response = self.do_request(query=query, variables=None)
+        failed_repo_ids = {
+            int(error['path'][0].split('_')[1])
+            for error in response.get('errors', [])
+            if error.get('type') != 'NOT_FOUND' and error.get('path')
+        }
+        if failed_repo_ids:
+            logging.warning(f'Commits of repos { sorted(failed_repo_ids) } failed, retry them later')
+        data = response.get('data') or {}
         commits = []
         for repo_index, repo_info in data.items():
             repo_id = int(repo_index.split('_')[1])
+            if repo_id in failed_repo_ids:
+                continue
             if repo_info is None:
                 for sha in commit_shas[repo_id]['shas']:
-                    commits.append({
-                        'repo_id': repo_id,
-                        'node_id': 'NOT_FOUND',
-                        'sha': sha,
-                        'additions': None,
-                        'deletions': None,
-                        'changed_files': None
-                    })
+                    commits.append(not_found_commit(repo_id, sha))
                 continue
             for commit_index, commit_info in repo_info.items():
                 if commit_info is None:
                     sha = commit_shas[repo_id]['shas'][int(commit_index.split('_')[1])]
-                    commits.append({
-                        'repo_id': repo_id,
-                        'node_id': 'NOT_FOUND',
-                        'sha': sha,
-                        'additions': None,
-                        'deletions': None,
-                        'changed_files': None
-                    })
+                    commits.append(not_found_commit(repo_id, sha))
                     continue
                 commits.append({
                     'repo_id': repo_id,
@@ -267,5 +345,5 @@ query getCommits($ids: [ID!]!, $first: Int!) {
                     'deletions': commit_info['deletions'],
                     'changed_files': commit_info['changedFilesIfAvailable']
                 })
-        print(commits)
+        logging.debug(commits)
         return commits
@@ -1,7 +1,10 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import Column, String, DateTime, JSON, Boolean, BigInteger, Integer
+from sqlalchemy import (
+    Column, String, Text, DateTime, JSON, Boolean, BigInteger, Integer, Index,
+    UniqueConstraint
+)
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -12,6 +15,8 @@ class EventSourceEnum(enum.Enum):
     USER_CREATED = 'user_created'
     # https://docs.github.com/en/rest/activity/events?apiVersion=2022-11-28#list-events-received-by-the-authenticated-user
     USER_RECEIVED = 'user_received'
+    # https://docs.github.com/en/webhooks/webhook-events-and-payloads
+    WEBHOOK = 'webhook'
 
 class GitHubEvent(Base):
     __tablename__ = 'github_events'
@@ -42,10 +47,81 @@ class GitHubEvent(Base):
         doc='Is PullRequestEvent, it means the node_id of the pull request; '
         'In PushEvent, it means the node_id of the commit, and so on.'
     )
+    pr_node_id = Column(
+        String(255), nullable=True,
+        doc='In PushEvent, the node_id of the pull request associated with the commit, '
+        'NOT_FOUND if the commit is not associated with any pull request.'
+    )
+    # generated from the payload on MySQL and PostgreSQL, filled by
+    # EventParser on the other dialects, never write them directly
+    pr_title = Column(String(512), nullable=True, index=True, doc='payload.pull_request.title')
+    ref = Column(String(255), nullable=True, index=True, doc='payload.ref, e.g. the branch of a push')
+    issue_number = Column(Integer, nullable=True, index=True, doc='payload.issue.number')
     event_source = Column(String(16), nullable=False, default=EventSourceEnum.USER_CREATED)
     created_at = Column(DateTime, nullable=True)
 
 
+class GitHubPushCommit(Base):
+    __tablename__ = 'github_push_commits'
+    __table_args__ = (
+        UniqueConstraint('event_id', 'sha', name='uq_github_push_commits_event_id_sha'),
+        Index('ix_github_push_commits_repo_id_sha', 'repo_id', 'sha'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(BigInteger, nullable=False, doc='The id of the PushEvent')
+    repo_id = Column(BigInteger, nullable=True)
+    sha = Column(String(64), nullable=False)
+    author_name = Column(String(255), nullable=True)
+    author_email = Column(String(255), nullable=True)
+    # full-text indexed on MySQL and PostgreSQL, see queries.search_push_commits
+    message = Column(Text, nullable=True)
+    distinct = Column(Boolean, nullable=True)
+    additions = Column(Integer, nullable=True)
+    deletions = Column(Integer, nullable=True)
+    changed_files = Column(Integer, nullable=True)
+    node_id = Column(
+        String(255), nullable=True,
+        doc='The node_id of the commit, NOT_FOUND if the commit can not be resolved'
+    )
+    created_at = Column(DateTime, nullable=True, default=datetime.utcnow)
+
+
+class GitHubSyncCheckpoint(Base):
+    __tablename__ = 'github_sync_checkpoints'
+
+    event_source = Column(String(16), primary_key=True)
+    page = Column(Integer, nullable=False, default=0, doc='The last committed page')
+    last_event_id = Column(BigInteger, nullable=True, doc='The last event of the last committed page')
+    completed = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class GitHubTableVersion(Base):
+    __tablename__ = 'github_table_versions'
+
+    table_name = Column(String(64), primary_key=True)
+    version = Column(
+        BigInteger, nullable=False, default=0,
+        doc='Bumped on every write of a sync, the query caches of all processes '
+        'drop the results computed from an older version'
+    )
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class GitHubPullRequestFile(Base):
+    __tablename__ = 'github_pull_request_files'
+
+    id = Column(Integer, primary_key=True)
+    pr_node_id = Column(String(255), nullable=False, index=True)
+    pr_number = Column(String(255), nullable=True)
+    repo_id = Column(BigInteger, nullable=True)
+    path = Column(String(1024), nullable=True)
+    additions = Column(Integer, nullable=True)
+    deletions = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=True, default=datetime.utcnow)
+
+
 class GitHubRepo(Base):
     __tablename__ = 'github_repos'
 
@@ -81,11 +157,18 @@ class GitHubUserStats(Base):
 
 class GitHubUserDynamicStats(Base):
     __tablename__ = 'github_user_dynamic_stats'
+    __table_args__ = (
+        Index('ix_github_user_dynamic_stats_dimension_created_at', 'dimension', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, nullable=True)
     user_login = Column(String(255), nullable=True)
-    dimension = Column(String(255), nullable=True)
+    dimension = Column(
+        String(255), nullable=True,
+        doc='e.g. total_minutes_used, or minutes_used_breakdown.UBUNTU for '
+        'the minutes used by every runner'
+    )
     int_value = Column(Integer, nullable=True)
     str_value = Column(String(255), nullable=True)
     json_value = Column(JSON, default=list, nullable=True)
@@ -0,0 +1,182 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+
+from my_github.profiling import profile_thread
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class StageStats:
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def throughput(self):
+        # items per busy second
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def __repr__(self):
+        return (
+            f'<StageStats { self.name }: { self.items } items, '
+            f'{ round(self.busy_seconds, 2) }s busy, { round(self.throughput, 1) } items/s>'
+        )
+
+
+class Pipeline:
+    """Run a source and a chain of stages concurrently, one thread per stage.
+
+    The source is a callable returning an iterator of items, every stage is a
+    `(name, func)` pair, `func(item)` returns the item passed to the next
+    stage, or None to drop it. Stages are connected by bounded queues, so a
+    fast stage blocks when the next one can not keep up.
+
+    If a stage raises, the stages before it stop, while the stages after it
+    still process the items already queued, e.g. the pages fetched before a
+    failed request are still written. `run()` raises the first error.
+
+    `teardown` is called at the end of every stage thread, e.g. to release
+    thread local database sessions.
+    """
+
+    def __init__(self, name, source, stages, queue_size=4, teardown=None):
+        self.name = name
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.teardown = teardown
+        self.stats = [StageStats('source')] + [StageStats(name) for name, _ in stages]
+        # one stop flag for the source and every stage
+        self._stopped = [threading.Event() for _ in self.stats]
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [self._thread(
+            'source', self._run_source, queues[0] if queues else None
+        )]
+        for i, (name, func) in enumerate(self.stages, start=1):
+            out_queue = queues[i] if i < len(queues) else None
+            threads.append(self._thread(
+                name, self._run_stage, i, func, queues[i - 1], out_queue
+            ))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for stats in self.stats:
+            logger.debug(f'Pipeline { self.name }: { stats }')
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
+
+    def _thread(self, name, target, *args):
+        # stage threads run in a copy of the caller's context, so they are
+        # profiled for the task which runs the pipeline
+        def run():
+            with profile_thread():
+                target(*args)
+        return threading.Thread(
+            target=contextvars.copy_context().run, args=(run,),
+            name=f'{ self.name }-{ name }', daemon=True
+        )
+
+    def _run_source(self, out_queue):
+        stats = self.stats[0]
+        try:
+            items = iter(self.source())
+            while True:
+                started_at = time.monotonic()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    stats.busy_seconds += time.monotonic() - started_at
+                stats.items += 1
+                if out_queue is not None:
+                    self._put(0, out_queue, item)
+        except PipelineAborted:
+            return
+        except Exception as e:
+            self._abort(0, e)
+        finally:
+            if out_queue is not None:
+                self._put_end(0, out_queue)
+            self._teardown()
+
+    def _run_stage(self, index, func, in_queue, out_queue):
+        stats = self.stats[index]
+        try:
+            while True:
+                item = self._get(index, in_queue)
+                if item is _END:
+                    break
+                started_at = time.monotonic()
+                try:
+                    result = func(item)
+                finally:
+                    stats.busy_seconds += time.monotonic() - started_at
+                stats.items += 1
+                if result is not None and out_queue is not None:
+                    self._put(index, out_queue, result)
+        except PipelineAborted:
+            return
+        except Exception as e:
+            self._abort(index, e)
+        finally:
+            if out_queue is not None:
+                self._put_end(index, out_queue)
+            self._teardown()
+
+    def _put(self, index, q, item):
+        while True:
+            if self._stopped[index].is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _put_end(self, index, q):
+        # let the next stage drain its queue and finish, unless it stopped
+        while not self._stopped[index + 1].is_set():
+            try:
+                q.put(_END, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, index, q):
+        while True:
+            if self._stopped[index].is_set():
+                raise PipelineAborted()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _abort(self, index, error):
+        logger.error(f'Pipeline { self.name } aborted in { self.stats[index].name }: { error }')
+        with self._lock:
+            self._errors.append(error)
+            for stopped in self._stopped[:index + 1]:
+                stopped.set()
+
+    def _teardown(self):
+        if self.teardown is not None:
+            self.teardown()
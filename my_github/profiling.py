@@ -0,0 +1,170 @@
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# python 3.12+ runs cProfile on sys.monitoring, which allows a single active
+# profiler per process recording the calls of every thread
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+# the task the current thread works for, threads started by a pipeline run in
+# a copy of the context of the task which started them
+_current_task = contextvars.ContextVar('profiling_task', default=None)
+_local = threading.local()
+
+
+class Profiler:
+    """Collect per task CPU profiles and busy time by category.
+
+    The categories are http, json_decode, event_parser, db_flush and sql.
+    Tasks run stages in several threads, so the busy time of a category
+    may exceed the wall time of its task. Without PER_THREAD_PROFILES the
+    profile of a task covers the whole process, so the tasks must run one
+    at a time to get a profile each.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.output_dir = None
+        self._lock = threading.Lock()
+        self._timings = defaultdict(lambda: defaultdict(float))
+        self._wall = {}
+        self._profiles = defaultdict(list)
+
+    def enable(self, output_dir):
+        self.enabled = True
+        self.output_dir = output_dir
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_flush_postexec', _after_flush)
+
+    def add_timing(self, category, seconds):
+        task = _current_task.get()
+        if task is None:
+            return
+        with self._lock:
+            self._timings[task][category] += seconds
+
+    def write_results(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary = {}
+        with self._lock:
+            for task, profiles in self._profiles.items():
+                path = os.path.join(self.output_dir, f'{ task }.prof')
+                pstats.Stats(*profiles).dump_stats(path)
+                logger.info(f'CPU profile of { task } written to { path }')
+            for task, wall in self._wall.items():
+                summary[task] = {
+                    'wall_seconds': round(wall, 3),
+                    'busy_seconds': {k: round(v, 3) for k, v in self._timings[task].items()},
+                }
+        path = os.path.join(self.output_dir, 'summary.json')
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f'Profiling summary written to { path }')
+        return summary
+
+
+profiler = Profiler()
+
+
+def timed(category):
+    # a no-op unless profiling is enabled
+    if not profiler.enabled:
+        return nullcontext()
+    return _timed(category)
+
+
+@contextmanager
+def _timed(category):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add_timing(category, time.perf_counter() - started_at)
+
+
+@contextmanager
+def profile_task(name):
+    # attribute everything the current thread does to the task
+    if not profiler.enabled:
+        yield
+        return
+    token = _current_task.set(name)
+    started_at = time.perf_counter()
+    try:
+        with profile_thread() if PER_THREAD_PROFILES else _profile(name):
+            yield
+    finally:
+        with profiler._lock:
+            profiler._wall[name] = time.perf_counter() - started_at
+        _current_task.reset(token)
+
+
+@contextmanager
+def profile_thread():
+    # CPU profile the current thread for the current task, a no-op without
+    # PER_THREAD_PROFILES, the profile of the task records every thread
+    task = _current_task.get()
+    if not profiler.enabled or task is None or not PER_THREAD_PROFILES:
+        yield
+        return
+    with _profile(task):
+        yield
+
+
+@contextmanager
+def _profile(task):
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # another profiler is active
+        logger.warning(
+            f'Can not profile { task } in thread { threading.current_thread().name }, '
+            f'another profiler is active'
+        )
+        yield
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        with profiler._lock:
+            profiler._profiles[task].append(profile)
+
+
+def _before_flush(session, flush_context, instances):
+    _local.flush_started_at = time.perf_counter()
+
+
+def _after_flush(session, flush_context):
+    started_at = getattr(_local, 'flush_started_at', None)
+    if started_at is not None:
+        profiler.add_timing('db_flush', time.perf_counter() - started_at)
+        _local.flush_started_at = None
+
+
+def instrument_engine(engine, slow_sql_ms=None):
+    # time the SQL statements, and log the ones slower than slow_sql_ms
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started_at'].pop()
+        profiler.add_timing('sql', elapsed)
+        if slow_sql_ms is not None and elapsed * 1000 >= slow_sql_ms:
+            logger.warning(f'Slow SQL ({ round(elapsed * 1000) }ms): { statement }')
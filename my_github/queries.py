@@ -0,0 +1,261 @@
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import func, case, literal_column, text, select, and_, or_
+
+from my_github.models import (
+    GitHubEvent, EventSourceEnum, GitHubUserStats, GitHubUserDynamicStats,
+    GitHubPushCommit, GitHubTableVersion
+)
+from my_github.stats import BILLING_BREAKDOWN_DIMENSION
+
+
+class QueryCache:
+    """A thread safe LRU cache whose entries expire after `ttl` seconds.
+
+    Every entry is tagged with the tables it was computed from, so the sync
+    functions can drop the entries of the tables they just wrote to.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # returns (hit, value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, tables, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, tables, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, frozenset(tables), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *tables):
+        # drop the entries of the given tables, or every entry if no table given
+        with self._lock:
+            if not tables:
+                self._entries.clear()
+                return
+            for key in [k for k, (_, t, _) in self._entries.items() if t.intersection(tables)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+query_cache = QueryCache()
+
+
+def invalidate(session, *tables):
+    # drop the cached results of the tables in this process, and bump the
+    # versions of the tables so the caches of other processes (e.g. a
+    # dashboard, while the sync runs from cron) drop them too
+    query_cache.invalidate(*tables)
+    for table in tables:
+        updated = session.query(GitHubTableVersion).where(
+            GitHubTableVersion.table_name == table
+        ).update({
+            'version': GitHubTableVersion.version + 1,
+            'updated_at': datetime.utcnow(),
+        }, synchronize_session=False)
+        if not updated:
+            session.add(GitHubTableVersion(table_name=table, version=1))
+    session.commit()
+
+
+def table_versions(session, tables):
+    rows = session.query(GitHubTableVersion.table_name, GitHubTableVersion.version).where(
+        GitHubTableVersion.table_name.in_(tables)
+    ).all()
+    versions = dict(rows)
+    return tuple(versions.get(table, 0) for table in tables)
+
+
+def cached_query(*tables, ttl=None):
+    # cache the result of a query function by its arguments, except the
+    # session which is always the first one, and by the versions of its
+    # tables. Callers get a copy, so mutating a result never corrupts the cache
+    def decorator(query_func):
+        @functools.wraps(query_func)
+        def wrapper(session, *args, **kwargs):
+            key = (
+                query_func.__name__, args, tuple(sorted(kwargs.items())),
+                table_versions(session, tables),
+            )
+            hit, value = query_cache.get(key)
+            if not hit:
+                value = query_func(session, *args, **kwargs)
+                query_cache.set(key, value, tables, ttl=ttl)
+            return copy.deepcopy(value)
+        return wrapper
+    return decorator
+
+
+def _in_range(query, column, since, until):
+    if since is not None:
+        query = query.where(column >= since)
+    if until is not None:
+        query = query.where(column < until)
+    return query
+
+
+def _source_filter(event_source):
+    # webhook events land before polling picks them up, the ones acted by the
+    # authenticated user count as created events until polling supersedes them
+    if event_source != EventSourceEnum.USER_CREATED.value:
+        return GitHubEvent.event_source == event_source
+    user_id = select(GitHubEvent.actor_id).where(
+        GitHubEvent.event_source == EventSourceEnum.USER_CREATED.value
+    ).limit(1).scalar_subquery()
+    return or_(
+        GitHubEvent.event_source == EventSourceEnum.USER_CREATED.value,
+        and_(
+            GitHubEvent.event_source == EventSourceEnum.WEBHOOK.value,
+            GitHubEvent.actor_id == user_id,
+        ),
+    )
+
+
+@cached_query(GitHubEvent.__tablename__)
+def contributions_by_repo(session, since=None, until=None,
+                          event_source=EventSourceEnum.USER_CREATED.value):
+    # [(repo_name, event_count, additions, deletions)], most active repo first
+    query = session.query(
+        GitHubEvent.repo_name,
+        func.count(GitHubEvent.id),
+        func.coalesce(func.sum(GitHubEvent.additions), 0),
+        func.coalesce(func.sum(GitHubEvent.deletions), 0),
+    ).where(
+        _source_filter(event_source)
+    )
+    query = _in_range(query, GitHubEvent.created_at, since, until)
+    rows = query.group_by(GitHubEvent.repo_name).order_by(func.count(GitHubEvent.id).desc()).all()
+    return [tuple(row) for row in rows]
+
+
+@cached_query(GitHubEvent.__tablename__)
+def contributions_by_day(session, since=None, until=None,
+                         event_source=EventSourceEnum.USER_CREATED.value):
+    # [(day, event_count)], oldest day first
+    day = func.date(GitHubEvent.created_at)
+    query = session.query(day, func.count(GitHubEvent.id)).where(
+        _source_filter(event_source)
+    )
+    query = _in_range(query, GitHubEvent.created_at, since, until)
+    rows = query.group_by(day).order_by(day).all()
+    return [(str(d), count) for d, count in rows]
+
+
+@cached_query(GitHubEvent.__tablename__)
+def pr_throughput(session, since=None, until=None,
+                  event_source=EventSourceEnum.USER_CREATED.value):
+    # [(day, opened, closed)] of pull requests, oldest day first
+    day = func.date(GitHubEvent.created_at)
+    query = session.query(
+        day,
+        func.sum(case((GitHubEvent.action == 'opened', 1), else_=0)),
+        func.sum(case((GitHubEvent.action == 'closed', 1), else_=0)),
+    ).where(
+        GitHubEvent.event_type == 'PullRequestEvent',
+        _source_filter(event_source),
+    )
+    query = _in_range(query, GitHubEvent.created_at, since, until)
+    rows = query.group_by(day).order_by(day).all()
+    return [(str(d), int(opened or 0), int(closed or 0)) for d, opened, closed in rows]
+
+
+@cached_query(GitHubUserStats.__tablename__)
+def latest_user_stats(session, user_id=None):
+    # the latest stats as a dict, None if there is no stats yet
+    query = session.query(GitHubUserStats)
+    if user_id is not None:
+        query = query.where(GitHubUserStats.user_id == user_id)
+    stats = query.order_by(GitHubUserStats.created_at.desc()).first()
+    if stats is None:
+        return None
+    return {c.name: getattr(stats, c.name) for c in GitHubUserStats.__table__.columns}
+
+
+@cached_query(GitHubUserDynamicStats.__tablename__)
+def billing_trend(session, dimension='total_minutes_used', since=None, until=None):
+    # [(created_at, value)] of an integer billing dimension, oldest first
+    query = session.query(
+        GitHubUserDynamicStats.created_at, GitHubUserDynamicStats.int_value
+    ).where(
+        GitHubUserDynamicStats.dimension == dimension
+    )
+    query = _in_range(query, GitHubUserDynamicStats.created_at, since, until)
+    return [tuple(row) for row in query.order_by(GitHubUserDynamicStats.created_at).all()]
+
+
+@cached_query(GitHubUserDynamicStats.__tablename__)
+def billing_breakdown_trend(session, since=None, until=None):
+    # {runner: [(created_at, minutes)]} of the minutes used by every runner
+    prefix = f'{ BILLING_BREAKDOWN_DIMENSION }.'
+    query = session.query(
+        GitHubUserDynamicStats.dimension,
+        GitHubUserDynamicStats.created_at,
+        GitHubUserDynamicStats.int_value,
+    ).where(
+        GitHubUserDynamicStats.dimension.startswith(prefix, autoescape=True)
+    )
+    query = _in_range(query, GitHubUserDynamicStats.created_at, since, until)
+    trend = {}
+    for dimension, created_at, minutes in query.order_by(GitHubUserDynamicStats.created_at).all():
+        trend.setdefault(dimension[len(prefix):], []).append((created_at, minutes))
+    return trend
+
+
+@cached_query(GitHubEvent.__tablename__)
+def pull_requests_by_title(session, title, limit=50):
+    # [(created_at, repo_name, pr_number, action, pr_title)] of the pull
+    # request events whose title starts with `title`, newest first
+    query = session.query(
+        GitHubEvent.created_at, GitHubEvent.repo_name, GitHubEvent.pr_number,
+        GitHubEvent.action, GitHubEvent.pr_title,
+    ).where(
+        GitHubEvent.pr_title.startswith(title, autoescape=True)
+    )
+    return [tuple(row) for row in query.order_by(GitHubEvent.created_at.desc()).limit(limit).all()]
+
+
+@cached_query(GitHubPushCommit.__tablename__)
+def search_push_commits(session, words, limit=50):
+    # [(event_id, repo_id, sha, message)] of the pushed commits whose message
+    # matches the words, uses the full-text index on MySQL and PostgreSQL
+    dialect = session.get_bind().dialect.name
+    query = session.query(
+        GitHubPushCommit.event_id, GitHubPushCommit.repo_id,
+        GitHubPushCommit.sha, GitHubPushCommit.message,
+    )
+    if dialect == 'mysql':
+        query = query.where(
+            text('MATCH (message) AGAINST (:words IN NATURAL LANGUAGE MODE)').bindparams(words=words)
+        )
+    elif dialect == 'postgresql':
+        # the same expression as the index, or it is not used
+        document = func.to_tsvector(literal_column("'english'"), func.coalesce(GitHubPushCommit.message, ''))
+        query = query.where(document.op('@@')(func.plainto_tsquery(literal_column("'english'"), words)))
+    else:
+        for word in words.split():
+            query = query.where(GitHubPushCommit.message.contains(word, autoescape=True))
+    rows = query.order_by(GitHubPushCommit.event_id.desc()).limit(limit).all()
+    return [tuple(row) for row in rows]
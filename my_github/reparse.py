@@ -0,0 +1,133 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from my_github.event_parser import EventParser, PAYLOAD_COLUMNS
+from my_github.event_store import add_push_commits, has_generated_payload_columns
+from my_github.models import GitHubEvent
+
+logger = logging.getLogger(__name__)
+
+# the columns EventParser derives from the payload
+DERIVED_COLUMNS = (
+    'action', 'commit_sha', 'pr_number', 'node_id',
+    'additions', 'deletions', 'changed_files',
+    *PAYLOAD_COLUMNS,
+)
+
+_SOURCE_COLUMNS = (
+    GitHubEvent.id, GitHubEvent.event_type,
+    GitHubEvent.actor_id, GitHubEvent.actor_login,
+    GitHubEvent.repo_id, GitHubEvent.repo_name,
+    GitHubEvent.payload, GitHubEvent.public,
+    GitHubEvent.org_id, GitHubEvent.org_login,
+    GitHubEvent.created_at,
+)
+
+
+def _raw_event(row):
+    # rebuild the events API shape of a stored event
+    raw_event = {
+        'id': row.id,
+        'type': row.event_type,
+        'actor': {'id': row.actor_id, 'login': row.actor_login},
+        'repo': {'id': row.repo_id, 'name': row.repo_name},
+        'payload': row.payload or {},
+        'public': row.public,
+        'created_at': row.created_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
+    if row.org_id is not None:
+        raw_event['org'] = {'id': row.org_id, 'login': row.org_login}
+    return raw_event
+
+
+def _reparse(raw_events):
+    # runs in a worker process, returns (event_id, derived columns, push
+    # commits) of every event which can be parsed
+    results = []
+    for raw_event in raw_events:
+        try:
+            e = EventParser(raw_event)
+        except (KeyError, TypeError, ValueError):
+            continue
+        derived = {k: v for k, v in e.event_dict.items() if k in DERIVED_COLUMNS}
+        results.append((raw_event['id'], derived, e.push_commits))
+    return results
+
+
+def _split(items, n):
+    size = max(1, -(-len(items) // n))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def reparse_events(session, chunk_size=1000, workers=None, throttle=0.0, event_types=None):
+    """Re-derive the columns of the stored events from their payload.
+
+    Events are read in chunks by id keyset, parsed by a process pool, and
+    only the changed values are written. A value enriched afterwards (e.g.
+    the node_id of a PushEvent) is never overwritten, because EventParser
+    does not derive it. `throttle` seconds are slept between chunks to limit
+    the load on a production database.
+
+    The workers are spawned, which re-imports the main module in every
+    worker, so it must be importable without side effects (main.py builds
+    its connections in `setup()`), and the caller must run from a file,
+    not from `python -`.
+    """
+    updated = 0
+    scanned = 0
+    added_commits = 0
+    last_id = None
+    workers = workers or os.cpu_count() or 1
+    columns = DERIVED_COLUMNS
+    if has_generated_payload_columns(session):
+        # the database keeps the generated columns up to date
+        columns = tuple(c for c in DERIVED_COLUMNS if c not in PAYLOAD_COLUMNS)
+    # forking copies the locks other task threads hold (logging, DB drivers)
+    # into the workers, which may then deadlock, spawn fresh interpreters
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    with pool:
+        while True:
+            query = session.query(*_SOURCE_COLUMNS, *(getattr(GitHubEvent, c) for c in columns))
+            if event_types:
+                query = query.where(GitHubEvent.event_type.in_(event_types))
+            if last_id is not None:
+                query = query.where(GitHubEvent.id > last_id)
+            rows = query.order_by(GitHubEvent.id).limit(chunk_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            scanned += len(rows)
+
+            stored = {row.id: row for row in rows}
+            raw_events = [_raw_event(row) for row in rows]
+            mappings = []
+            push_commits = []
+            for results in pool.map(_reparse, _split(raw_events, workers)):
+                for event_id, derived, commits in results:
+                    row = stored[event_id]
+                    changed = {
+                        k: v for k, v in derived.items()
+                        if k in columns and v is not None and str(v) != str(getattr(row, k))
+                    }
+                    if changed:
+                        mappings.append({'id': event_id, **changed})
+                    if commits:
+                        push_commits.append((event_id, row.repo_id, commits))
+
+            if mappings:
+                session.bulk_update_mappings(GitHubEvent, mappings)
+            chunk_commits = add_push_commits(session, push_commits)
+            session.commit()
+            updated += len(mappings)
+            added_commits += chunk_commits
+            logger.info(
+                f'Reparsed { len(rows) } events up to id { last_id }: '
+                f'{ len(mappings) } updated, { chunk_commits } push commits added '
+                f'(total: { scanned } reparsed, { updated } updated, { added_commits } push commits added)'
+            )
+            if throttle:
+                time.sleep(throttle)
+    return updated
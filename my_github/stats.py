@@ -0,0 +1,123 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from my_github.models import GitHubUserStats, GitHubUserDynamicStats
+
+logger = logging.getLogger(__name__)
+
+
+class StatsChangeDetector:
+    """Decide whether a stats value needs to be written.
+
+    A value is written when it differs from the last stored one, or when the
+    last stored one is older than `heartbeat`. The last stored values are kept
+    in memory, so only the first check of a key in a process hits the database.
+    """
+
+    def __init__(self, heartbeat=timedelta(hours=24)):
+        self.heartbeat = heartbeat
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def should_write(self, key, value, load_last):
+        # load_last() returns (value, created_at) of the last stored row, or None
+        with self._lock:
+            if key not in self._last:
+                self._last[key] = load_last()
+            last = self._last[key]
+        if last is None:
+            return True
+        last_value, last_created_at = last
+        if last_value != value:
+            return True
+        return datetime.utcnow() - last_created_at >= self.heartbeat
+
+    def written(self, key, value, created_at):
+        with self._lock:
+            self._last[key] = (value, created_at)
+
+
+BILLING_BREAKDOWN_DIMENSION = 'minutes_used_breakdown'
+
+
+def billing_breakdown_dimension(runner):
+    # e.g. minutes_used_breakdown.UBUNTU
+    return f'{ BILLING_BREAKDOWN_DIMENSION }.{ runner }'
+
+
+def backfill_billing_breakdown(session, batch_size=500):
+    # explode the minutes_used_breakdown JSON rows into one integer row per
+    # runner, the JSON rows are deleted once exploded
+    exploded = 0
+    while True:
+        rows = session.query(GitHubUserDynamicStats).where(
+            GitHubUserDynamicStats.dimension == BILLING_BREAKDOWN_DIMENSION
+        ).order_by(GitHubUserDynamicStats.id).limit(batch_size).all()
+        if not rows:
+            break
+        for row in rows:
+            for runner, minutes in (row.json_value or {}).items():
+                session.add(GitHubUserDynamicStats(
+                    user_id=row.user_id,
+                    user_login=row.user_login,
+                    dimension=billing_breakdown_dimension(runner),
+                    int_value=minutes,
+                    created_at=row.created_at,
+                ))
+            session.delete(row)
+        session.commit()
+        exploded += len(rows)
+    logger.info(f'Exploded { exploded } billing breakdown rows')
+    return exploded
+
+
+COMPACT_GRANULARITIES = {
+    'hourly': '%Y-%m-%d %H',
+    'daily': '%Y-%m-%d',
+}
+
+
+def compact_stats(session, granularity, batch_size=1000):
+    # downsample the stats history, only the last row of every
+    # hour/day is kept for each user and dimension
+    bucket_format = COMPACT_GRANULARITIES[granularity]
+    deleted = 0
+    deleted += _compact(
+        session, GitHubUserStats,
+        (GitHubUserStats.user_id,),
+        bucket_format, batch_size
+    )
+    deleted += _compact(
+        session, GitHubUserDynamicStats,
+        (GitHubUserDynamicStats.user_id, GitHubUserDynamicStats.dimension),
+        bucket_format, batch_size
+    )
+    return deleted
+
+
+def _compact(session, model, group_columns, bucket_format, batch_size):
+    rows = session.query(
+        model.id, model.created_at, *group_columns
+    ).order_by(
+        *group_columns, model.created_at, model.id
+    ).yield_per(batch_size)
+
+    to_delete = []
+    deleted = 0
+    last_bucket = None
+    last_id = None
+    for row_id, created_at, *group in rows:
+        bucket = (tuple(group), created_at.strftime(bucket_format) if created_at else None)
+        if bucket == last_bucket:
+            to_delete.append(last_id)
+        last_bucket = bucket
+        last_id = row_id
+
+    for i in range(0, len(to_delete), batch_size):
+        chunk = to_delete[i:i + batch_size]
+        session.query(model).where(model.id.in_(chunk)).delete(synchronize_session=False)
+        session.commit()
+        deleted += len(chunk)
+    logger.info(f'Compacted { model.__tablename__ }: { deleted } rows deleted')
+    return deleted
@@ -0,0 +1,135 @@
+import enum
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStatus(enum.Enum):
+    SUCCESS = 'success'
+    FAILED = 'failed'
+    TIMEOUT = 'timeout'
+    SKIPPED = 'skipped'
+
+
+class Task:
+
+    def __init__(self, name, func, depends_on=(), timeout=None):
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on)
+        # seconds, None means no timeout
+        self.timeout = timeout
+
+
+class TaskResult:
+
+    def __init__(self, name, status, elapsed=0.0, error=None):
+        self.name = name
+        self.status = status
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == TaskStatus.SUCCESS
+
+
+class TaskRunner:
+    """Run tasks concurrently, each one in its own thread.
+
+    A task starts as soon as all the tasks it depends on succeeded, and is
+    skipped if any of them did not. A task running longer than its timeout is
+    reported as timed out, its thread is a daemon thread and is abandoned.
+    At most `max_workers` tasks run at the same time, None means no limit.
+    """
+
+    def __init__(self, tasks, max_workers=None):
+        self.tasks = {task.name: task for task in tasks}
+        self.max_workers = max_workers
+        for task in tasks:
+            for dep in task.depends_on:
+                if dep not in self.tasks:
+                    raise ValueError(f'Task { task.name } depends on unknown task { dep }')
+
+    def run(self):
+        results = {}
+        running = {}
+        done_queue = queue.Queue()
+
+        while len(results) < len(self.tasks):
+            self._schedule(results, running, done_queue)
+
+            if not running:
+                # the remaining tasks wait for each other
+                for name in self.tasks:
+                    if name not in results:
+                        logger.error(f'Task { name } skipped, its dependencies can not be resolved')
+                        results[name] = TaskResult(name, TaskStatus.SKIPPED)
+                break
+
+            try:
+                result = done_queue.get(timeout=self._next_deadline(running))
+            except queue.Empty:
+                result = None
+            if result is not None and result.name in running:
+                running.pop(result.name)
+                results[result.name] = result
+
+            now = time.monotonic()
+            for name, started_at in list(running.items()):
+                timeout = self.tasks[name].timeout
+                if timeout is not None and now - started_at >= timeout:
+                    logger.error(f'Task { name } timed out after { timeout }s')
+                    running.pop(name)
+                    results[name] = TaskResult(name, TaskStatus.TIMEOUT, elapsed=now - started_at)
+
+        return [results[name] for name in self.tasks]
+
+    def _schedule(self, results, running, done_queue):
+        # skipping a task may unblock the tasks depending on it, so repeat
+        # until nothing changes
+        changed = True
+        while changed:
+            changed = False
+            for name, task in self.tasks.items():
+                if name in results or name in running:
+                    continue
+                dep_results = [results.get(dep) for dep in task.depends_on]
+                if any(r is not None and not r.ok for r in dep_results):
+                    logger.warning(f'Task { name } skipped, its dependencies did not succeed')
+                    results[name] = TaskResult(name, TaskStatus.SKIPPED)
+                    changed = True
+                elif all(r is not None for r in dep_results):
+                    if self.max_workers is not None and len(running) >= self.max_workers:
+                        return
+                    running[name] = time.monotonic()
+                    threading.Thread(
+                        target=self._run_task, args=(task, done_queue),
+                        name=name, daemon=True
+                    ).start()
+
+    def _next_deadline(self, running):
+        now = time.monotonic()
+        deadlines = [
+            started_at + self.tasks[name].timeout - now
+            for name, started_at in running.items()
+            if self.tasks[name].timeout is not None
+        ]
+        return max(min(deadlines), 0) if deadlines else None
+
+    def _run_task(self, task, done_queue):
+        started_at = time.monotonic()
+        try:
+            task.func()
+        except Exception as e:
+            logger.exception(f'Task { task.name } failed')
+            done_queue.put(TaskResult(
+                task.name, TaskStatus.FAILED, elapsed=time.monotonic() - started_at, error=e
+            ))
+        else:
+            done_queue.put(TaskResult(
+                task.name, TaskStatus.SUCCESS, elapsed=time.monotonic() - started_at
+            ))
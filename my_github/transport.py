@@ -0,0 +1,89 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+from urllib3.util.retry import Retry
+
+# https://docs.github.com/en/rest/using-the-rest-api/troubleshooting-the-rest-api
+RETRY_STATUSES = (502, 503, 504)
+
+
+class TransportConfig:
+    """HTTP transport settings shared by the REST and GraphQL clients.
+
+    Connection resets, timeouts and 502/503/504 responses of the idempotent
+    methods are retried with an exponential backoff.
+    """
+
+    def __init__(
+            self,
+            pool_size=10,
+            connect_timeout=5,
+            read_timeout=30,
+            max_retries=3,
+            backoff_factor=0.5):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def create_sessions(self, headers, retry_methods=Retry.DEFAULT_ALLOWED_METHODS):
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(retry_methods),
+            backoff_factor=self.backoff_factor,
+            respect_retry_after_header=True,
+            # the last response is returned and handled by the client
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        return ThreadLocalSessions(adapter, {
+            'Accept-Encoding': 'gzip, deflate',
+            **headers,
+        })
+
+
+class ThreadLocalSessions:
+    """A requests.Session per thread, all on one shared adapter.
+
+    The connection pools of the adapter are thread safe and shared, so
+    connections are reused across threads. A session keeps cookies and
+    other state which is not, so every thread gets its own one.
+    """
+
+    def __init__(self, adapter, headers):
+        self.adapter = adapter
+        self.headers = headers
+        self._local = threading.local()
+
+    def get(self):
+        if not hasattr(self._local, 'session'):
+            session = requests.Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            session.headers.update(self.headers)
+            self._local.session = session
+        return self._local.session
+
+
+def is_timeout(exception):
+    # once the read retries are used up requests raises a ConnectionError
+    # wrapping the ReadTimeoutError instead of a Timeout
+    if isinstance(exception, requests.exceptions.Timeout):
+        return True
+    reason = exception.args[0] if exception.args else None
+    return isinstance(reason, MaxRetryError) and isinstance(reason.reason, ReadTimeoutError)
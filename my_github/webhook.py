@@ -0,0 +1,286 @@
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from my_github.models import GitHubEvent, EventSourceEnum
+
+logger = logging.getLogger(__name__)
+
+
+# https://docs.github.com/en/webhooks/webhook-events-and-payloads
+WEBHOOK_EVENT_TYPES = {
+    'commit_comment': 'CommitCommentEvent',
+    'create': 'CreateEvent',
+    'delete': 'DeleteEvent',
+    'discussion': 'DiscussionEvent',
+    'fork': 'ForkEvent',
+    'gollum': 'GollumEvent',
+    'issue_comment': 'IssueCommentEvent',
+    'issues': 'IssuesEvent',
+    'member': 'MemberEvent',
+    'public': 'PublicEvent',
+    'pull_request': 'PullRequestEvent',
+    'pull_request_review': 'PullRequestReviewEvent',
+    'pull_request_review_comment': 'PullRequestReviewCommentEvent',
+    'push': 'PushEvent',
+    'release': 'ReleaseEvent',
+    'watch': 'WatchEvent',
+}
+
+# {event type: {webhook action: events API action}} of the event types with an
+# action, deliveries with other actions are never published by the events API
+# (e.g. a pull request synchronize or edited), so polling could never
+# supersede them and they are dropped
+# https://docs.github.com/en/rest/using-the-rest-api/github-event-types
+WEBHOOK_EVENT_ACTIONS = {
+    'CommitCommentEvent': {'created': 'created'},
+    'DiscussionEvent': {'created': 'created'},
+    'IssueCommentEvent': {'created': 'created'},
+    'IssuesEvent': {'opened': 'opened', 'closed': 'closed', 'reopened': 'reopened'},
+    'MemberEvent': {'added': 'added'},
+    'PullRequestEvent': {'opened': 'opened', 'closed': 'closed', 'reopened': 'reopened'},
+    'PullRequestReviewEvent': {'submitted': 'created'},
+    'PullRequestReviewCommentEvent': {'created': 'created'},
+    'ReleaseEvent': {'published': 'published'},
+    'WatchEvent': {'started': 'started'},
+}
+
+# keys of the webhook payload which are in the top level of an event
+WEBHOOK_ENVELOPE_KEYS = ('repository', 'sender', 'organization', 'installation', 'enterprise')
+
+# a webhook event and the same event polled later are not created at exactly
+# the same time
+RECONCILE_WINDOW = timedelta(minutes=10)
+
+
+def verify_signature(secret, body, signature):
+    # https://docs.github.com/en/webhooks/using-webhooks/validating-webhook-deliveries
+    if not signature or not signature.startswith('sha256='):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(f'sha256={ expected }', signature)
+
+
+def webhook_event_id(delivery_id):
+    # webhook deliveries do not carry the id of the events API, use a negative
+    # id derived from the delivery id so it never collides with a real one
+    digest = hashlib.sha256(delivery_id.encode()).hexdigest()
+    return -(int(digest[:15], 16) + 1)
+
+
+def normalize_webhook_event(event_name, delivery_id, payload, received_at=None):
+    # transform a webhook delivery into the shape of the events API, which is
+    # what EventParser expects, returns None for unsupported webhook events
+    event_type = WEBHOOK_EVENT_TYPES.get(event_name)
+    if event_type is None or 'repository' not in payload:
+        return None
+    action = None
+    if event_type in WEBHOOK_EVENT_ACTIONS:
+        action = WEBHOOK_EVENT_ACTIONS[event_type].get(payload.get('action'))
+        if action is None:
+            return None
+
+    repo = payload['repository']
+    sender = payload.get('sender') or {}
+    received_at = received_at or datetime.utcnow()
+    event = {
+        'id': str(webhook_event_id(delivery_id)),
+        'type': event_type,
+        'actor': {'id': sender.get('id'), 'login': sender.get('login')},
+        'repo': {'id': repo['id'], 'name': repo['full_name']},
+        'payload': {k: v for k, v in payload.items() if k not in WEBHOOK_ENVELOPE_KEYS},
+        'public': not repo.get('private', False),
+        'created_at': received_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
+    if payload.get('organization'):
+        event['org'] = {
+            'id': payload['organization']['id'],
+            'login': payload['organization']['login'],
+        }
+    if action is not None:
+        event['payload']['action'] = action
+    if event_type == 'PushEvent':
+        event['payload'] = _normalize_push_payload(payload)
+    return event
+
+
+def _normalize_push_payload(payload):
+    commits = payload.get('commits') or []
+    return {
+        'size': len(commits),
+        'distinct_size': sum(1 for c in commits if c.get('distinct')),
+        'ref': payload['ref'],
+        'head': payload['after'],
+        'before': payload['before'],
+        'commits': [{
+            'sha': c['id'],
+            'author': {
+                'email': c['author'].get('email'),
+                'name': c['author'].get('name'),
+            },
+            'message': c['message'],
+            'distinct': c.get('distinct', True),
+            'url': c.get('url'),
+        } for c in commits],
+    }
+
+
+def find_superseded_webhook_events(session, event_dicts):
+    # polled events supersede the webhook events received for them, returns
+    # the ids of these webhook events
+    if not event_dicts:
+        return []
+    created_ats = [e['created_at'] for e in event_dicts]
+    webhook_events = session.query(GitHubEvent).where(
+        GitHubEvent.event_source == EventSourceEnum.WEBHOOK.value,
+        GitHubEvent.created_at >= min(created_ats) - RECONCILE_WINDOW,
+        GitHubEvent.created_at <= max(created_ats) + RECONCILE_WINDOW,
+    ).all()
+    if not webhook_events:
+        return []
+
+    superseded = []
+    for e in event_dicts:
+        for w in webhook_events:
+            if w.id in superseded or not _is_same_event(e, w):
+                continue
+            superseded.append(w.id)
+            break
+    return superseded
+
+
+def find_unmatched_webhook_events(session, event_dicts):
+    # the webhook events of the actors of the polled events which are older
+    # than the newest polled event but were not superseded by it, polling
+    # will never publish them, returns their ids
+    if not event_dicts:
+        return []
+    actor_ids = {e['actor_id'] for e in event_dicts if e['actor_id'] is not None}
+    newest = max(e['created_at'] for e in event_dicts)
+    return [event_id for event_id, in session.query(GitHubEvent.id).where(
+        GitHubEvent.event_source == EventSourceEnum.WEBHOOK.value,
+        GitHubEvent.actor_id.in_(actor_ids),
+        GitHubEvent.created_at < newest - RECONCILE_WINDOW,
+    )]
+
+
+def _is_same_event(event_dict, webhook_event):
+    w = webhook_event
+    if (w.event_type, w.repo_id, w.action) != (
+            event_dict['event_type'], event_dict['repo_id'], event_dict['action']):
+        return False
+    if event_dict.get('commit_sha'):
+        return w.commit_sha == event_dict['commit_sha']
+    if event_dict.get('node_id'):
+        return w.node_id == event_dict['node_id']
+    return (
+        w.actor_id == event_dict['actor_id']
+        and abs(w.created_at - event_dict['created_at']) <= RECONCILE_WINDOW
+    )
+
+
+class WebhookEventBatcher:
+    """Batch the received webhook events and save them in a worker thread.
+
+    A batch is saved when it has `batch_size` events, or when its first event
+    has waited `flush_interval` seconds.
+    """
+
+    def __init__(self, save, batch_size=100, flush_interval=5, max_queue_size=10000):
+        self.save = save
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='webhook_batcher', daemon=True)
+
+    def start(self):
+        self._worker.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._worker.join()
+
+    def put(self, raw_event, timeout=1):
+        # raises queue.Full when the worker can not keep up
+        self.queue.put(raw_event, timeout=timeout)
+
+    def _run(self):
+        while not (self._stopped.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.save(batch)
+            except Exception:
+                # the events are recovered by the next polling sync
+                logger.exception(f'Failed to save { len(batch) } webhook events')
+            else:
+                logger.info(f'Saved { len(batch) } webhook events')
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not verify_signature(self.server.secret, body, self.headers.get('X-Hub-Signature-256')):
+            self._respond(401, 'invalid signature')
+            return
+
+        event_name = self.headers.get('X-GitHub-Event')
+        if event_name == 'ping':
+            self._respond(200, 'pong')
+            return
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._respond(400, 'invalid payload')
+            return
+        raw_event = normalize_webhook_event(
+            event_name, self.headers.get('X-GitHub-Delivery', ''), payload
+        )
+        if raw_event is None:
+            self._respond(202, 'ignored')
+            return
+
+        try:
+            self.server.batcher.put(raw_event)
+        except queue.Full:
+            self._respond(503, 'busy')
+            return
+        self._respond(202, 'accepted')
+
+    def _respond(self, status, message):
+        body = message.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def create_webhook_server(host, port, secret, batcher):
+    server = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+    server.secret = secret
+    server.batcher = batcher
+    return server
@@ -0,0 +1,52 @@
+import argparse
+import glob
+import hashlib
+import hmac
+import json
+import os
+import uuid
+
+import requests
+
+PAYLOADS_DIR = os.path.join(os.path.dirname(__file__), 'webhook_payloads')
+
+
+def sign(secret, body):
+    # the X-Hub-Signature-256 header GitHub sends with every delivery
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def replay(url, secret, path, new_delivery=False):
+    # post a recorded delivery to a webhook receiver, returns the response
+    with open(path) as f:
+        recorded = json.load(f)
+    body = json.dumps(recorded['payload']).encode()
+    delivery = str(uuid.uuid4()) if new_delivery else recorded['delivery']
+    return requests.post(url, data=body, timeout=10, headers={
+        'Content-Type': 'application/json',
+        'X-GitHub-Event': recorded['event'],
+        'X-GitHub-Delivery': delivery,
+        'X-Hub-Signature-256': sign(secret, body),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Post recorded webhook deliveries to a local `main.py --serve-webhooks`'
+    )
+    parser.add_argument('paths', nargs='*', help=f'Recorded deliveries, all of { PAYLOADS_DIR } by default')
+    parser.add_argument('--url', default='http://127.0.0.1:8080/')
+    parser.add_argument('--secret', default=os.environ.get('WEBHOOK_SECRET', ''))
+    parser.add_argument(
+        '--new-delivery', action='store_true',
+        help='Send a random delivery id, so the receiver stores the event again'
+    )
+    args = parser.parse_args()
+    paths = args.paths or sorted(glob.glob(os.path.join(PAYLOADS_DIR, '*.json')))
+    for path in paths:
+        response = replay(args.url, args.secret, path, args.new_delivery)
+        print(f'{ os.path.basename(path) }: { response.status_code } { response.text }')
+
+
+if __name__ == '__main__':
+    main()